@@ -0,0 +1,70 @@
+"""
+Load test comparing the sync gunicorn worker (wsgi.py) with the ASGI entry point (asgi.py).
+Both servers run a single process against the same seeded database and receive the
+same number of concurrent GET /user requests.
+
+    $ python benchmarks/async_load.py [DB_CONNECTION_STRING]
+
+Needs gunicorn and uvicorn installed. Defaults to a sqlite file in the temp folder.
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from common import SRC, load_app, seed, percentile
+
+USERS = 2000
+REQUESTS = 200
+CONCURRENCY = 20
+PATH = '/user?limit=200'
+
+SERVERS = [
+    ("gunicorn sync", ['gunicorn', 'wsgi', '--chdir', SRC, '-w', '1', '--log-level', 'warning', '-b', '127.0.0.1:%d']),
+    ("uvicorn asgi", ['uvicorn', 'asgi:application', '--app-dir', SRC, '--log-level', 'warning', '--port', '%d']),
+]
+
+
+def wait_until_up(url, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start: %s' % url)
+
+
+def timed_get(url):
+    start = time.perf_counter()
+    urllib.request.urlopen(url).read()
+    return time.perf_counter() - start
+
+
+def main():
+    db_url = sys.argv[1] if len(sys.argv) > 1 else 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'async_load.db')
+    seed(load_app(db_url), users=USERS, addresses_per_user=2)
+    env = dict(os.environ, DB_CONNECTION_STRING=db_url, RESPONSE_CACHE='none')
+
+    for port, (name, command) in enumerate(SERVERS, 5101):
+        command = [part % port if '%d' in part else part for part in command]
+        server = subprocess.Popen(command, env=env)
+        try:
+            url = 'http://127.0.0.1:%d%s' % (port, PATH)
+            wait_until_up(url)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(CONCURRENCY) as pool:
+                latencies = list(pool.map(timed_get, [url] * REQUESTS))
+            elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+        print("%-14s %7.1f req/s   p50 %6.1f ms   p95 %6.1f ms" % (
+            name, REQUESTS / elapsed, percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000))
+
+
+if __name__ == '__main__':
+    main()
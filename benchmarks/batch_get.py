@@ -0,0 +1,47 @@
+"""
+Compares loading a grid of products one GET /product/<id> at a time with a single
+GET /product?ids=..., in time and SQL statements.
+
+    $ python benchmarks/batch_get.py
+"""
+import random
+import time
+from common import load_app, seed, StatementCounter
+
+PRODUCTS = 10000
+GRID = 48
+ROUNDS = 50
+
+
+def main():
+    app = load_app()
+    from models import db
+    import main as api
+
+    seed(app, products=PRODUCTS, pictures_per_product=3)
+    client = app.test_client()
+    random.seed(1)
+    grids = [random.sample(range(1, PRODUCTS + 1), GRID) for _ in range(ROUNDS)]
+
+    def one_by_one(ids):
+        for i in ids:
+            assert client.get('/product/%d' % i).status_code == 200
+
+    def batch(ids):
+        assert client.get('/product?ids=%s' % ','.join(map(str, ids))).status_code == 200
+
+    with app.app_context():
+        for name, load in (("one request per product", one_by_one), ("?ids= batch", batch)):
+            with StatementCounter(db.engine) as counter:
+                start = time.perf_counter()
+                for ids in grids:
+                    # every round would be a cache hit otherwise
+                    api.CACHE.invalidate('product:')
+                    load(ids)
+                elapsed = (time.perf_counter() - start) / ROUNDS
+            print("%-26s %8.2f ms per %d product grid   %5.1f statements" % (
+                name, elapsed * 1000, GRID, counter.count / float(ROUNDS)))
+
+
+if __name__ == '__main__':
+    main()
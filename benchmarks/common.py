@@ -0,0 +1,79 @@
+"""
+Shared helpers for the benchmark scripts: load the app against a scratch database,
+seed it with fake rows, count the SQL statements a request issues and compute percentiles
+"""
+import os
+import sys
+from decimal import Decimal
+from sqlalchemy import event
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC)
+
+
+def load_app(db_url='sqlite://'):
+    # main.py reads the connection string at import time
+    os.environ['DB_CONNECTION_STRING'] = db_url
+    import main
+    return main.create_app(tooling=False)
+
+
+def seed(app, users=0, addresses_per_user=1, products=0, pictures_per_product=1, billing_per_user=None):
+    from models import db, User, Product, Address, BillingAddress, Picture
+
+    if billing_per_user is None:
+        billing_per_user = addresses_per_user
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        if users:
+            db.session.execute(User.__table__.insert(), [{
+                "id": i, "userFirstName": "First%d" % i, "userLastName": "Last%d" % i,
+                "userName": "user%d" % i, "email": "user%d@example.com" % i, "password": "secret%d" % i
+            } for i in range(1, users + 1)])
+        if users and addresses_per_user:
+            db.session.execute(Address.__table__.insert(), [{
+                "userStreet": "Main St", "userNumber": str(j), "userCity": "Miami", "userState": "FL",
+                "userZipCode": "33101", "isBillingAddress": True, "person_id": i
+            } for i in range(1, users + 1) for j in range(addresses_per_user)])
+        if users and billing_per_user:
+            db.session.execute(BillingAddress.__table__.insert(), [{
+                "billingStreet": "Main St", "billingNumber": str(j), "billingCity": "Miami", "billingState": "FL",
+                "billingZipCode": "33101", "person_id": i
+            } for i in range(1, users + 1) for j in range(billing_per_user)])
+        if products:
+            db.session.execute(Product.__table__.insert(), [{
+                "id": i, "productName": "Product %d" % i, "productDescription": "Description of product %d" % i,
+                "productPrice": Decimal("%d.99" % (i % 100)), "productCategory": "category%d" % (i % 10),
+                "productAgeRange": "%d-%d" % (i % 5, i % 5 + 3)
+            } for i in range(1, products + 1)])
+        if products and pictures_per_product:
+            db.session.execute(Picture.__table__.insert(), [{
+                "picture_url": "https://example.com/%d/%d.jpg" % (i, j), "photos_id": i
+            } for i in range(1, products + 1) for j in range(pictures_per_product)])
+        db.session.commit()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+class StatementCounter(object):
+    """
+    Context manager that counts the statements sent to the database engine
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
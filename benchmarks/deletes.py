@@ -0,0 +1,63 @@
+"""
+Prints the statements of the deletes the database cascades, DELETE /user/<id> and /product/<id>,
+and of DELETE /picture?photos_id=, and compares deleting pictures one request at a time with one
+bulk request. The behaviour of the deletes is checked in tests/test_deletes.py.
+
+    $ python benchmarks/deletes.py
+"""
+import time
+from common import load_app, seed, StatementCounter
+
+USERS = 200
+PRODUCTS = 2000
+PICTURES = 5
+BULK = 500
+
+
+def main():
+    app = load_app()
+    from models import db, Picture
+
+    seed(app, users=USERS, addresses_per_user=20, products=PRODUCTS, pictures_per_product=PICTURES)
+    client = app.test_client()
+    token = client.post('/login', json={
+        "userName": "user1", "email": "user1@example.com", "password": "secret1"}).get_json()['jwt']
+    auth = {'Authorization': 'Bearer %s' % token}
+    with app.app_context():
+        engine = db.engine
+
+    def statements(call):
+        with StatementCounter(engine) as counter:
+            response = call()
+        assert response.status_code == 200, response.get_data()
+        return response, counter.count
+
+    # the children go with their parent, none of them is loaded
+    _, count = statements(lambda: client.delete('/user/2', headers=auth))
+    print("DELETE /user/2 (20 addresses, 20 billing addresses)   %d statements" % count)
+    client.get('/product/1')
+    _, count = statements(lambda: client.delete('/product/1'))
+    print("DELETE /product/1 (%d pictures)                        %d statements" % (PICTURES, count))
+
+    # all the pictures of a product
+    _, count = statements(lambda: client.delete('/picture?photos_id=2'))
+    print("DELETE /picture?photos_id=2                            %d statements" % count)
+
+    with app.app_context():
+        ids = [i for (i,) in db.session.query(Picture.id).order_by(Picture.id).limit(2 * BULK)]
+    start = time.perf_counter()
+    with StatementCounter(engine) as counter:
+        for i in ids[:BULK]:
+            assert client.delete('/picture/%d' % i).status_code == 200
+    single = time.perf_counter() - start
+    print("%d x DELETE /picture/<id>                             %7.1f ms  %d statements" % (
+        BULK, single * 1000, counter.count))
+    start = time.perf_counter()
+    _, count = statements(lambda: client.delete('/picture?ids=%s' % ','.join(map(str, ids[BULK:]))))
+    bulk = time.perf_counter() - start
+    print("DELETE /picture?ids= with %d ids                      %7.1f ms  %d statements" % (
+        BULK, bulk * 1000, count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,447 @@
+"""
+Benchmark harness for every route of src/main.py.
+Seeds a database, sends the same requests to each route through the Flask test client (in process,
+SQL statements counted per request) and through a real gunicorn process (concurrent HTTP clients,
+SQL statements read from the Server-Timing header PROFILING adds), and reports p50/p95/p99 latency,
+throughput and SQL statements per request for each route.
+The results are saved as JSON, --compare flags the routes that got slower or run more SQL than
+in an earlier run and exits with status 1 when there is any.
+
+    $ python benchmarks/harness.py
+    $ python benchmarks/harness.py --users 5000 --products 20000 --requests 500 --modes gunicorn
+    $ python benchmarks/harness.py --compare benchmarks/results/<earlier run>.json
+
+Defaults to a sqlite file in the temp folder, --db takes any DB_CONNECTION_STRING.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from common import SRC, load_app, seed, StatementCounter, percentile
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+# routes that are not part of the api
+IGNORED = {'/static/<path:filename>', '/metrics'}
+ASYNC = {'Prefer': 'respond-async'}
+GZIP = {'Accept-Encoding': 'gzip'}
+SQL_TIMING = re.compile(r'sql;desc="(\d+) queries"')
+
+
+class Scenario(object):
+    """
+    How to call one route: build(n) returns (url, json body or None) for the n-th request,
+    headers are sent on top of the auth header and a status in expected doesn't count as an error
+    """
+
+    def __init__(self, method, rule, build, label=None, headers=None, expected=()):
+        self.method = method
+        self.rule = rule
+        self.build = build
+        self.name = '%s %s' % (method, label or rule)
+        self.headers = headers or {}
+        self.expected = expected
+
+    def failed(self, status):
+        return status >= 400 and status not in self.expected
+
+
+def scenarios(args):
+    users, products = args.users, args.products
+    sizes = {
+        'person_id': users,
+        'product_id': products,
+        'address_id': users * args.addresses,
+        'billingaddress_id': users * args.billing,
+        'picture_id': products * args.pictures,
+    }
+    # rows created by reserve() for the DELETE requests, with nothing pointing to them
+    reserved = dict((key, size + 1) for key, size in sizes.items())
+
+    def pick(key):
+        return random.randint(1, max(sizes[key], 1))
+
+    address = {"userStreet": "Bench St", "userNumber": "1", "userCity": "Tampa", "userState": "FL",
+               "userZipCode": "33601", "isBillingAddress": False}
+    billing = {"billingStreet": "Bench St", "billingNumber": "1", "billingCity": "Tampa", "billingState": "FL",
+               "billingZipCode": "33601"}
+
+    def product(n, prefix='Bench'):
+        return {"productName": "%s %d" % (prefix, n), "productDescription": "%s description %d" % (prefix, n),
+                "productPrice": "%d.50" % (n % 100), "productCategory": "category%d" % (n % 10),
+                "productAgeRange": "3-6"}
+
+    return [
+        Scenario('GET', '/', lambda n: ('/', None)),
+        Scenario('GET', '/sitemap.json', lambda n: ('/sitemap.json', None)),
+        Scenario('GET', '/health', lambda n: ('/health', None)),
+        Scenario('GET', '/health', lambda n: ('/health?deep=1', None), label='/health?deep=1'),
+        Scenario('GET', '/cache/stats', lambda n: ('/cache/stats', None)),
+        Scenario('GET', '/pool/stats', lambda n: ('/pool/stats', None)),
+        Scenario('GET', '/writes/stats', lambda n: ('/writes/stats', None)),
+        # the outcome of a queued write is only known to the worker that queued it, this times the lookup
+        Scenario('GET', '/writes/<tracking_id>', lambda n: ('/writes/%032x' % n, None),
+                 label='/writes/<tracking_id> (unknown id)', expected=(404,)),
+        Scenario('POST', '/login', lambda n: ('/login', {
+            "userName": "user%d" % (n % users + 1), "email": "user%d@example.com" % (n % users + 1),
+            "password": "secret%d" % (n % users + 1)})),
+
+        Scenario('GET', '/user', lambda n: ('/user', None)),
+        Scenario('GET', '/user', lambda n: ('/user', None), label='/user (gzip)', headers=GZIP),
+        Scenario('GET', '/user', lambda n: ('/user?limit=50', None), label='/user?limit=50'),
+        Scenario('POST', '/user', lambda n: ('/user', {
+            "userFirstName": "Bench", "userLastName": "User", "userName": "bench%d" % n,
+            "email": "bench%d@example.com" % n, "password": "secret", "addresses": []})),
+        Scenario('GET', '/user/<int:person_id>', lambda n: ('/user/%d' % pick('person_id'), None)),
+        Scenario('PUT', '/user/<int:person_id>', lambda n: ('/user/%d' % pick('person_id'), {
+            "email": "updated%d@example.com" % n})),
+        Scenario('PATCH', '/user/<int:person_id>', lambda n: ('/user/%d' % pick('person_id'), {
+            "email": "patched%d@example.com" % n})),
+        Scenario('DELETE', '/user/<int:person_id>', lambda n: ('/user/%d' % (reserved['person_id'] + n), None)),
+
+        Scenario('GET', '/product', lambda n: ('/product', None)),
+        Scenario('GET', '/product', lambda n: ('/product', None), label='/product (gzip)', headers=GZIP),
+        Scenario('GET', '/product', lambda n: ('/product?limit=50&sort=-productPrice', None),
+                 label='/product?limit=50&sort=-productPrice'),
+        Scenario('GET', '/product', lambda n: ('/product?productCategory=category%d&limit=50' % (n % 10), None),
+                 label='/product?productCategory=..&limit=50'),
+        Scenario('POST', '/product', lambda n: ('/product', product(n))),
+        Scenario('POST', '/product/bulk', lambda n: ('/product/bulk', [
+            product(n * 50 + i, 'Bulk') for i in range(50)])),
+        Scenario('GET', '/product/stats', lambda n: ('/product/stats?bucket=%d' % (10 + n % 5), None)),
+        Scenario('GET', '/product/search', lambda n: ('/product/search?q=product+%d' % pick('product_id'), None)),
+        Scenario('GET', '/product/<int:product_id>', lambda n: ('/product/%d' % pick('product_id'), None)),
+        Scenario('PUT', '/product/<int:product_id>', lambda n: ('/product/%d' % pick('product_id'), {
+            "productPrice": "%d.25" % (n % 100)})),
+        Scenario('PATCH', '/product/<int:product_id>', lambda n: ('/product/%d' % pick('product_id'), {
+            "productPrice": "%d.75" % (n % 100)})),
+        Scenario('DELETE', '/product/<int:product_id>', lambda n: ('/product/%d' % (reserved['product_id'] + n), None)),
+
+        Scenario('GET', '/address', lambda n: ('/address', None)),
+        Scenario('POST', '/address', lambda n: ('/address', dict(address, person_id=pick('person_id')))),
+        Scenario('POST', '/address/bulk', lambda n: ('/address/bulk', [
+            dict(address, person_id=pick('person_id')) for _ in range(50)])),
+        Scenario('GET', '/address/<int:address_id>', lambda n: ('/address/%d' % pick('address_id'), None)),
+        Scenario('PUT', '/address/<int:address_id>', lambda n: ('/address/%d' % pick('address_id'), {
+            "userCity": "Orlando"})),
+        Scenario('PUT', '/address/<int:address_id>', lambda n: ('/address/%d' % pick('address_id'), {
+            "userCity": "Orlando"}), label='/address/<int:address_id> (respond-async)', headers=ASYNC),
+        Scenario('PATCH', '/address/<int:address_id>', lambda n: ('/address/%d' % pick('address_id'), {
+            "userCity": "Orlando"})),
+        Scenario('PATCH', '/address/<int:address_id>', lambda n: ('/address/%d' % pick('address_id'), {
+            "userCity": "Orlando"}), label='/address/<int:address_id> (return=minimal)',
+            headers={'Prefer': 'return=minimal'}),
+        Scenario('DELETE', '/address/<int:address_id>', lambda n: ('/address/%d' % (reserved['address_id'] + n), None)),
+
+        Scenario('GET', '/billingaddress', lambda n: ('/billingaddress', None)),
+        Scenario('POST', '/billingaddress', lambda n: ('/billingaddress', dict(billing, person_id=pick('person_id')))),
+        Scenario('POST', '/billingaddress/bulk', lambda n: ('/billingaddress/bulk', [
+            dict(billing, person_id=pick('person_id')) for _ in range(50)])),
+        Scenario('GET', '/billingaddress/<int:billingaddress_id>', lambda n: (
+            '/billingaddress/%d' % pick('billingaddress_id'), None)),
+        Scenario('PUT', '/billingaddress/<int:billingaddress_id>', lambda n: (
+            '/billingaddress/%d' % pick('billingaddress_id'), {"billingCity": "Orlando"})),
+        Scenario('PATCH', '/billingaddress/<int:billingaddress_id>', lambda n: (
+            '/billingaddress/%d' % pick('billingaddress_id'), {"billingCity": "Orlando"})),
+        Scenario('DELETE', '/billingaddress/<int:billingaddress_id>', lambda n: (
+            '/billingaddress/%d' % (reserved['billingaddress_id'] + n), None)),
+
+        Scenario('GET', '/picture', lambda n: ('/picture', None)),
+        Scenario('POST', '/picture', lambda n: ('/picture', {
+            "picture_url": "https://example.com/bench/%d.jpg" % n, "photos_id": pick('product_id')})),
+        Scenario('POST', '/picture', lambda n: ('/picture', {
+            "picture_url": "https://example.com/async/%d.jpg" % n, "photos_id": pick('product_id')}),
+            label='/picture (respond-async)', headers=ASYNC),
+        Scenario('POST', '/picture/bulk', lambda n: ('/picture/bulk', [{
+            "picture_url": "https://example.com/bulk/%d/%d.jpg" % (n, i), "photos_id": pick('product_id')
+        } for i in range(50)])),
+        Scenario('GET', '/picture/<int:picture_id>', lambda n: ('/picture/%d' % pick('picture_id'), None)),
+        Scenario('PUT', '/picture/<int:picture_id>', lambda n: ('/picture/%d' % pick('picture_id'), {
+            "PictureURL": "https://example.com/updated/%d.jpg" % n})),
+        Scenario('DELETE', '/picture/<int:picture_id>', lambda n: ('/picture/%d' % (reserved['picture_id'] + n), None)),
+        # the second half of the reserved pictures
+        Scenario('DELETE', '/picture', lambda n: ('/picture?ids=%d' % (reserved['picture_id'] + args.requests + n), None),
+                 label='/picture?ids='),
+    ], reserved
+
+
+def reserve(app, reserved, count):
+    """
+    Inserts count rows per table, from the ids in reserved on, for the DELETE requests to remove
+    """
+    from models import db, User, Product, Address, BillingAddress, Picture
+
+    with app.app_context():
+        start = reserved['person_id']
+        db.session.execute(User.__table__.insert(), [{
+            "id": i, "userFirstName": "Delete", "userLastName": "Me", "userName": "delete%d" % i,
+            "email": "delete%d@example.com" % i, "password": "secret"
+        } for i in range(start, start + count)])
+        start = reserved['product_id']
+        db.session.execute(Product.__table__.insert(), [{
+            "id": i, "productName": "Delete %d" % i, "productDescription": "Delete %d" % i, "productPrice": 1
+        } for i in range(start, start + count)])
+        for model, key, row in (
+                (Address, 'address_id', {"userStreet": "x", "userNumber": "1", "userCity": "x", "userState": "x",
+                                         "userZipCode": "x", "person_id": 1}),
+                (BillingAddress, 'billingaddress_id', {"person_id": 1}),
+                (Picture, 'picture_id', {"picture_url": "https://example.com/delete.jpg", "photos_id": 1})):
+            start = reserved[key]
+            # DELETE /picture?ids= removes as many pictures as DELETE /picture/<id>
+            total = count * 2 if model is Picture else count
+            db.session.execute(model.__table__.insert(), [dict(row, id=i) for i in range(start, start + total)])
+        if db.engine.dialect.name == 'postgresql':
+            # rows inserted with an explicit id don't move the sequences, the POST requests would reuse the ids
+            for model in (User, Product, Address, BillingAddress, Picture):
+                db.session.execute(text("SELECT setval(pg_get_serial_sequence('%s', 'id'), max(id)) FROM %s" % (
+                    model.__tablename__, model.__tablename__)))
+        db.session.commit()
+
+
+def prepare(app, args, reserved):
+    seed(app, users=args.users, addresses_per_user=args.addresses, billing_per_user=args.billing,
+         products=args.products, pictures_per_product=args.pictures)
+    reserve(app, reserved, args.requests)
+
+
+def summarize(latencies, errors, elapsed, statements=None):
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50Ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95Ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99Ms": round(percentile(latencies, 99) * 1000, 3),
+        "meanMs": round(sum(latencies) / len(latencies) * 1000, 3),
+        "throughput": round(len(latencies) / elapsed, 2),
+    }
+    if statements is not None:
+        result["sqlPerRequest"] = round(statements / float(len(latencies)), 2)
+    return result
+
+
+def run_testclient(app, args, plan, headers):
+    from models import db
+
+    client = app.test_client()
+    results = {}
+    with app.app_context():
+        engine = db.engine
+    for scenario in plan:
+        latencies, errors = [], 0
+        with StatementCounter(engine) as counter:
+            start = time.perf_counter()
+            for n in range(args.requests):
+                url, body = scenario.build(n)
+                t = time.perf_counter()
+                try:
+                    response = client.open(url, method=scenario.method, json=body,
+                                           headers=dict(headers, **scenario.headers))
+                    response.get_data()
+                    failed = scenario.failed(response.status_code)
+                except Exception:
+                    # the test client re-raises what the view raised, gunicorn would answer 500
+                    failed = True
+                latencies.append(time.perf_counter() - t)
+                errors += failed
+            elapsed = time.perf_counter() - start
+        results[scenario.name] = summarize(latencies, errors, elapsed, counter.count)
+        report('testclient', scenario.name, results[scenario.name])
+    return results
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def http_call(base, method, url, body, headers):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(base + url, data=data, method=method, headers=dict(
+        headers, **({'Content-Type': 'application/json'} if data is not None else {})))
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status, timing = response.status, response.headers.get('Server-Timing', '')
+    except urllib.error.HTTPError as error:
+        error.read()
+        status, timing = error.code, error.headers.get('Server-Timing', '')
+    match = SQL_TIMING.search(timing)
+    return time.perf_counter() - start, status, int(match.group(1)) if match else 0
+
+
+def run_gunicorn(args, plan, headers, env):
+    port = free_port()
+    base = 'http://127.0.0.1:%d' % port
+    server = subprocess.Popen(['gunicorn', 'wsgi', '--chdir', SRC, '-w', str(args.workers),
+                               '--log-level', 'warning', '-b', '127.0.0.1:%d' % port], env=env)
+    results = {}
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                urllib.request.urlopen(base + '/health').read()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.2)
+
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            for scenario in plan:
+                calls = [scenario.build(n) for n in range(args.requests)]
+                start = time.perf_counter()
+                done = list(pool.map(lambda call: http_call(base, scenario.method, call[0], call[1],
+                                                            dict(headers, **scenario.headers)), calls))
+                elapsed = time.perf_counter() - start
+                results[scenario.name] = summarize([latency for latency, _, _ in done],
+                                                   sum(1 for _, status, _ in done if scenario.failed(status)), elapsed,
+                                                   sum(statements for _, _, statements in done))
+                report('gunicorn', scenario.name, results[scenario.name])
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+def report(mode, name, result):
+    print("%-10s %-48s p50 %8.2f  p95 %8.2f  p99 %8.2f ms  %8.1f req/s  sql %6s  errors %d" % (
+        mode, name, result['p50Ms'], result['p95Ms'], result['p99Ms'], result['throughput'],
+        result.get('sqlPerRequest', '-'), result['errors']))
+
+
+# smaller changes are noise, not regressions
+MIN_P95_DELTA_MS = 1.0
+MIN_SQL_DELTA = 0.5
+
+
+def compare(previous, current, threshold):
+    """
+    Prints the routes whose p95 grew by more than threshold percent or that run more SQL statements,
+    returns how many there are
+    """
+    regressions = 0
+    for mode, routes in current['results'].items():
+        for name, result in routes.items():
+            old = previous['results'].get(mode, {}).get(name)
+            if old is None:
+                continue
+            problems = []
+            if (result['p95Ms'] > old['p95Ms'] * (1 + threshold / 100.0) and
+                    result['p95Ms'] - old['p95Ms'] >= MIN_P95_DELTA_MS):
+                problems.append('p95 %.2f -> %.2f ms' % (old['p95Ms'], result['p95Ms']))
+            if result.get('sqlPerRequest', 0) - old.get('sqlPerRequest', 0) >= MIN_SQL_DELTA:
+                problems.append('sql %s -> %s' % (old.get('sqlPerRequest'), result.get('sqlPerRequest')))
+            if result['errors'] > old['errors']:
+                problems.append('errors %d -> %d' % (old['errors'], result['errors']))
+            if problems:
+                regressions += 1
+                print("REGRESSION %-10s %-48s %s" % (mode, name, ', '.join(problems)))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=SRC,
+                                       stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', default='sqlite:///' + os.path.join(tempfile.gettempdir(), 'harness.db'))
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--addresses', type=int, default=2, help='addresses per user')
+    parser.add_argument('--billing', type=int, default=1, help='billing addresses per user')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--pictures', type=int, default=2, help='pictures per product')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients against gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--modes', default='testclient,gunicorn')
+    parser.add_argument('--routes', help='only the scenarios whose name matches this regular expression')
+    parser.add_argument('--password-iterations', type=int, default=10000,
+                        help='PASSWORD_HASH_ITERATIONS, lower than production to keep runs short')
+    parser.add_argument('--no-cache', action='store_true', help='run with RESPONSE_CACHE=none')
+    parser.add_argument('--out', help='where to save the results, defaults to benchmarks/results/<time>.json')
+    parser.add_argument('--compare', help='results of an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=20, help='p95 growth in percent counted as a regression')
+    args = parser.parse_args()
+
+    os.environ['PROFILING'] = '1'
+    os.environ['PASSWORD_HASH_ITERATIONS'] = str(args.password_iterations)
+    if args.no_cache:
+        os.environ['RESPONSE_CACHE'] = 'none'
+    random.seed(1)
+    app = load_app(args.db)
+    plan, reserved = scenarios(args)
+    rules = set((method, rule.rule) for rule in app.url_map.iter_rules() if rule.rule not in IGNORED
+                for method in rule.methods - {'HEAD', 'OPTIONS'})
+    skipped = sorted('%s %s' % route for route in rules - set((s.method, s.rule) for s in plan))
+    if skipped:
+        print("routes without a scenario: %s" % ', '.join(skipped))
+    if args.routes:
+        plan = [scenario for scenario in plan if re.search(args.routes, scenario.name)]
+
+    output = {
+        "meta": {
+            "started": datetime.datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "db": re.sub(r'//[^@/]*@', '//***@', args.db),
+            "seed": {"users": args.users, "addressesPerUser": args.addresses, "billingPerUser": args.billing,
+                     "products": args.products, "picturesPerProduct": args.pictures},
+            "requests": args.requests, "concurrency": args.concurrency, "workers": args.workers,
+            "passwordIterations": args.password_iterations, "responseCache": not args.no_cache
+        },
+        "skipped": skipped,
+        "results": {}
+    }
+
+    for mode in args.modes.split(','):
+        # both modes start from the same data
+        prepare(app, args, reserved)
+        with app.app_context():
+            token = app.test_client().post('/login', json={
+                "userName": "user1", "email": "user1@example.com", "password": "secret1"}).get_json()['jwt']
+        headers = {'Authorization': 'Bearer %s' % token}
+        if mode == 'testclient':
+            output['results'][mode] = run_testclient(app, args, plan, headers)
+        elif mode == 'gunicorn':
+            env = dict(os.environ, DB_CONNECTION_STRING=args.db)
+            output['results'][mode] = run_gunicorn(args, plan, headers, env)
+        else:
+            parser.error('unknown mode %s' % mode)
+
+    path = args.out or os.path.join(RESULTS_DIR, '%s.json' % datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
+    if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+        os.makedirs(os.path.dirname(os.path.abspath(path)))
+    with open(path, 'w') as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+    print("results saved to %s" % path)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), output, args.threshold)
+        print("%d regressions against %s" % (regressions, args.compare))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
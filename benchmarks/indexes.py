@@ -0,0 +1,56 @@
+"""
+Shows the query plans and timings of the foreign key and login lookups
+without and with the indexes declared in models.py.
+
+    $ python benchmarks/indexes.py [DB_CONNECTION_STRING]
+
+Defaults to an in-memory sqlite database, pass a postgres url to run it on a local stand-in.
+"""
+import sys
+import time
+from sqlalchemy import select, text
+from common import load_app, seed
+
+USERS = 20000
+PRODUCTS = 20000
+LOOKUPS = 500
+
+
+def main():
+    app = load_app(sys.argv[1] if len(sys.argv) > 1 else 'sqlite://')
+    from models import db, User, Address, BillingAddress, Picture
+
+    seed(app, users=USERS, addresses_per_user=2, products=PRODUCTS, pictures_per_product=2)
+
+    lookups = [
+        ("addresses by person_id", lambda i: select(Address).where(Address.person_id == i)),
+        ("billing addresses by person_id", lambda i: select(BillingAddress).where(BillingAddress.person_id == i)),
+        ("pictures by photos_id", lambda i: select(Picture).where(Picture.photos_id == i)),
+        ("login by userName + email", lambda i: select(User).where(
+            User.userName == "user%d" % i, User.email == "user%d@example.com" % i)),
+    ]
+    indexes = [index for table in db.metadata.sorted_tables for index in table.indexes]
+
+    with app.app_context():
+        conn = db.session.connection()
+        dialect = db.engine.dialect
+        explain = "EXPLAIN QUERY PLAN " if dialect.name == 'sqlite' else "EXPLAIN "
+
+        for label, create in (("without indexes", False), ("with indexes", True)):
+            for index in indexes:
+                index.drop(conn, checkfirst=True)
+                if create:
+                    index.create(conn)
+            print("=== %s ===" % label)
+            for name, build in lookups:
+                sql = str(build(1).compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+                plan = [" ".join(str(col) for col in row) for row in conn.execute(text(explain + sql))]
+                start = time.perf_counter()
+                for i in range(1, LOOKUPS + 1):
+                    conn.execute(build(i)).all()
+                elapsed = (time.perf_counter() - start) / LOOKUPS
+                print("%-32s %8.3f ms/lookup   plan: %s" % (name, elapsed * 1000, " | ".join(plan)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Times token verification for a protected route: decoding and checking the signature of the
+JWT on every call against the cached path in auth.py.
+
+    $ python benchmarks/jwt_verification.py
+"""
+import time
+from common import load_app
+
+CALLS = 20000
+
+
+def per_call(func):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        func()
+    return (time.perf_counter() - start) / CALLS * 1000000
+
+
+def main():
+    app = load_app()
+    from flask_jwt_simple import create_jwt
+    from flask_jwt_simple.utils import decode_jwt
+    import auth
+
+    with app.test_request_context():
+        token = create_jwt(identity='user500')
+
+        auth.verify_token(token)
+        print("%-28s %8.2f us/call" % ("decode + verify signature", per_call(lambda: decode_jwt(token))))
+        print("%-28s %8.2f us/call" % ("cached verify_token", per_call(lambda: auth.verify_token(token))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Login requests per second through POST /login at different PASSWORD_HASH_ITERATIONS,
+with one client and with many concurrent clients, and the latency of a cheap GET /product
+served while the logins run.
+
+    $ python benchmarks/login.py
+"""
+import os
+import time
+import tempfile
+import threading
+from common import load_app, seed
+
+USERS = 200
+COSTS = (10000, 100000, 260000, 600000)
+CLIENTS = 16
+DURATION = 3.0
+
+
+def run_logins(app, clients, stop):
+    counts = []
+
+    def worker(n):
+        client = app.test_client()
+        done = 0
+        while not stop.is_set():
+            i = (n * 7919 + done) % USERS + 1
+            response = client.post('/login', json={
+                "userName": "user%d" % i, "email": "user%d@example.com" % i, "password": "secret%d" % i})
+            assert response.status_code == 200
+            done += 1
+        counts.append(done)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    return threads, counts
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'login.db')
+    app = load_app('sqlite:///' + path)
+    from models import db, User
+    import passwords
+
+    seed(app, users=USERS, products=10)
+    client = app.test_client()
+    print("hashing threads: %d" % passwords.HASH_EXECUTOR._max_workers)
+    for cost in COSTS:
+        passwords.ITERATIONS = cost
+        with app.app_context():
+            for user in User.query.all():
+                user.password = passwords.hash_password("secret%d" % user.id)
+            db.session.commit()
+
+        for clients in (1, CLIENTS):
+            stop = threading.Event()
+            start = time.perf_counter()
+            threads, counts = run_logins(app, clients, stop)
+            latencies = []
+            while time.perf_counter() - start < DURATION:
+                t = time.perf_counter()
+                assert client.get('/product?limit=1').status_code == 200
+                latencies.append((time.perf_counter() - t) * 1000)
+                time.sleep(0.01)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            latencies.sort()
+            print("%7d iterations  %2d clients  %8.1f logins/s   GET /product p50 %6.2f ms  max %7.2f ms" % (
+                cost, clients, sum(counts) / elapsed, latencies[len(latencies) // 2], latencies[-1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Compares PUT with PATCH (one UPDATE ... RETURNING) and PATCH with Prefer: return=minimal on
+/address/<id>, in time and SQL statements per request. The behaviour of PATCH is checked in
+tests/test_patch.py.
+
+    $ python benchmarks/patch.py
+"""
+import time
+from common import load_app, seed, StatementCounter
+
+USERS = 1000
+ROUNDS = 2000
+
+
+def main():
+    app = load_app()
+    from models import db
+
+    seed(app, users=USERS, addresses_per_user=1, products=10, pictures_per_product=2)
+    client = app.test_client()
+
+    cases = [
+        ("PUT", lambda n: client.put('/address/%d' % (n % USERS + 1), json={"userCity": "City %d" % n})),
+        ("PATCH", lambda n: client.patch('/address/%d' % (n % USERS + 1), json={"userCity": "City %d" % n})),
+        ("PATCH return=minimal", lambda n: client.patch('/address/%d' % (n % USERS + 1), json={
+            "userCity": "City %d" % n}, headers={'Prefer': 'return=minimal'})),
+    ]
+    with app.app_context():
+        engine = db.engine
+    for name, call in cases:
+        with StatementCounter(engine) as counter:
+            start = time.perf_counter()
+            for n in range(ROUNDS):
+                assert call(n).status_code in (200, 204)
+            elapsed = time.perf_counter() - start
+        print("%-22s %7.3f ms per request   %4.1f statements" % (
+            name, elapsed * 1000 / ROUNDS, counter.count / float(ROUNDS)))
+
+
+if __name__ == '__main__':
+    main()
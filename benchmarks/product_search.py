@@ -0,0 +1,76 @@
+"""
+Builds the product search index on a 100k product catalog and times
+ranked searches and prefix (autocomplete) searches through GET /product/search,
+then searches with a product update every 10 searches, checked against the table every time.
+
+    $ python benchmarks/product_search.py
+"""
+import random
+import time
+from decimal import Decimal
+from common import load_app, seed, percentile
+
+PRODUCTS = 100000
+QUERIES = 500
+WORDS = ("wooden plastic metal soft musical classic electric magnetic colorful giant tiny "
+         "train truck puzzle doll blocks robot ball kite drum teddy bear car boat plane "
+         "castle farm kitchen garden dinosaur rocket").split()
+
+
+def main():
+    app = load_app()
+    from models import db, Product
+    import main as api
+    import search
+
+    random.seed(1)
+    seed(app)
+    with app.app_context():
+        db.session.execute(Product.__table__.insert(), [{
+            "productName": "%s %s %d" % (random.choice(WORDS), random.choice(WORDS), i),
+            "productDescription": "%s %s %s toy number %d" % (random.choice(WORDS), random.choice(WORDS),
+                                                               random.choice(WORDS), i),
+            "productPrice": Decimal("%d.99" % (i % 100)),
+            "productCategory": random.choice(("toys", "games", "outdoor", "baby", "books"))
+        } for i in range(PRODUCTS)])
+        db.session.commit()
+
+        start = time.perf_counter()
+        api.SEARCH_INDEX.ensure_fresh()
+        print("index build: %.2fs for %d products, %d tokens" % (
+            time.perf_counter() - start, len(api.SEARCH_INDEX.docs), len(api.SEARCH_INDEX.vocabulary)))
+
+    client = app.test_client()
+    searches = [
+        ("two words", lambda: "%s %s" % (random.choice(WORDS), random.choice(WORDS))),
+        ("prefix", lambda: random.choice(WORDS)[:3]),
+        ("word + prefix", lambda: "%s %s" % (random.choice(WORDS), random.choice(WORDS)[:2])),
+        ("exact name", lambda: "%s %s %d" % (random.choice(WORDS), random.choice(WORDS), random.randrange(PRODUCTS))),
+    ]
+    for name, make_query in searches:
+        latencies = []
+        for _ in range(QUERIES):
+            url = '/product/search?q=%s' % make_query().replace(' ', '+')
+            start = time.perf_counter()
+            assert client.get(url).status_code == 200
+            latencies.append((time.perf_counter() - start) * 1000)
+        print("%-14s p50 %6.2f ms   p95 %6.2f ms   p99 %6.2f ms" % (
+            name, percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)))
+
+    # the updates made by this process are applied to the index, they don't make it re-sync
+    search.SYNC_INTERVAL = 0
+    latencies = []
+    for n in range(QUERIES):
+        if n % 10 == 0:
+            assert client.put('/product/%d' % random.randrange(1, PRODUCTS), json={
+                "productName": "%s %s renamed %d" % (random.choice(WORDS), random.choice(WORDS), n)}).status_code == 200
+        url = '/product/search?q=%s+%s' % (random.choice(WORDS), random.choice(WORDS))
+        start = time.perf_counter()
+        assert client.get(url).status_code == 200
+        latencies.append((time.perf_counter() - start) * 1000)
+    print("%-14s p50 %6.2f ms   p95 %6.2f ms   p99 %6.2f ms" % (
+        "with updates", percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)))
+
+
+if __name__ == '__main__':
+    main()
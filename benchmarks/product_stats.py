@@ -0,0 +1,61 @@
+"""
+Times GET /product/stats, computed with SQL aggregates, against the same numbers
+built with a Python loop over every product row, on growing catalogs.
+
+    $ python benchmarks/product_stats.py [DB_CONNECTION_STRING]
+
+Defaults to an in-memory sqlite database, pass a postgres url to run it on a local stand-in.
+"""
+import sys
+import time
+from sqlalchemy import select
+from common import load_app, seed
+
+CATALOGS = (10000, 100000, 300000)
+BUCKET = 25
+RUNS = 5
+
+
+def python_stats(db, Product):
+    # what the endpoint would have to do with prices stored as strings
+    categories = {}
+    for category, price in db.session.execute(select(Product.productCategory, Product.productPrice)):
+        price = float(price)
+        stats = categories.setdefault(category, {"count": 0, "min": price, "max": price, "sum": 0.0, "histogram": {}})
+        stats["count"] += 1
+        stats["min"] = min(stats["min"], price)
+        stats["max"] = max(stats["max"], price)
+        stats["sum"] += price
+        slot = int(price // BUCKET)
+        stats["histogram"][slot] = stats["histogram"].get(slot, 0) + 1
+    return categories
+
+
+def timed(func):
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        func()
+    return (time.perf_counter() - start) / RUNS * 1000
+
+
+def main():
+    app = load_app(sys.argv[1] if len(sys.argv) > 1 else 'sqlite://')
+    from models import db, Product
+    import main as api
+
+    client = app.test_client()
+    for size in CATALOGS:
+        seed(app, products=size, pictures_per_product=0)
+        # the endpoint is cached, clear it so every run hits the database
+        def sql_endpoint():
+            api.CACHE.invalidate('product:stats')
+            assert client.get('/product/stats?bucket=%d' % BUCKET).status_code == 200
+
+        with app.app_context():
+            loop_ms = timed(lambda: python_stats(db, Product))
+        sql_ms = timed(sql_endpoint)
+        print("%7d products   SQL aggregates %8.2f ms   python loop %8.2f ms" % (size, sql_ms, loop_ms))
+
+
+if __name__ == '__main__':
+    main()
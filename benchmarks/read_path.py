@@ -0,0 +1,78 @@
+"""
+Compares three ways of answering GET /address, /billingaddress and /picture without pagination,
+in time and in peak memory (tracemalloc) at 10k and 100k rows:
+the ORM path (Model.query.all() + serialize() + jsonify), the whole result fetched with Core
+and serialized into a list of dicts (RowSerializer.fetch) and the partitioned path the routes use
+(RowSerializer.encode). tests/test_collections.py checks the three return the same json.
+
+    $ python benchmarks/read_path.py
+"""
+import time
+import tracemalloc
+from common import load_app, seed
+
+SIZES = [10000, 100000]
+REPEAT = 3
+
+
+def best_of(func):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    app = load_app()
+    from flask import jsonify
+    from models import db, Address, BillingAddress, Picture
+    from serializers import ADDRESS, BILLING_ADDRESS, PICTURE, dumps
+    from utils import STREAM_CHUNK_SIZE
+
+    def orm_path(model):
+        def run():
+            body = jsonify([x.serialize() for x in model.query.order_by(model.id).all()]).get_data()
+            db.session.expunge_all()
+            return body
+        return run
+
+    def fetch_path(model, serializer):
+        def run():
+            return dumps(serializer.fetch(serializer.select().order_by(model.id), all_rows=True))
+        return run
+
+    def encode_path(model, serializer):
+        def run():
+            return serializer.encode(serializer.select().order_by(model.id), STREAM_CHUNK_SIZE)
+        return run
+
+    targets = [("/address", Address, ADDRESS), ("/billingaddress", BillingAddress, BILLING_ADDRESS),
+               ("/picture", Picture, PICTURE)]
+    print("%-16s %7s %22s %22s %22s" % ("route", "rows", "orm+jsonify", "core fetch", "core partitions"))
+    for size in SIZES:
+        # one address and billing address per user, one picture per product
+        seed(app, users=size, products=size)
+        with app.test_request_context():
+            for route, model, serializer in targets:
+                paths = [orm_path(model), fetch_path(model, serializer), encode_path(model, serializer)]
+                cells = []
+                for path in paths:
+                    seconds = best_of(path)
+                    db.session.expunge_all()
+                    cells.append("%7.1f ms %7.1f MB" % (seconds * 1000, peak_memory(path) / 1e6))
+                print("%-16s %7d %22s %22s %22s" % ((route, size) + tuple(cells)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Times a mix of reads and writes against two SQLite files, a primary and a copy of it standing in
+for a replica, and prints the statements each database served. The routing itself is checked
+in tests/test_replicas.py.
+
+    $ python benchmarks/replica_routing.py
+"""
+import os
+import time
+import shutil
+import tempfile
+from collections import Counter
+
+STALENESS = 1.0
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    primary, replica = os.path.join(directory, 'primary.db'), os.path.join(directory, 'replica.db')
+    # read at import time
+    os.environ['DB_REPLICA_URLS'] = 'sqlite:///' + replica
+    os.environ['DB_REPLICA_STALENESS'] = str(STALENESS)
+    from common import load_app, seed
+    app = load_app('sqlite:///' + primary)
+    from sqlalchemy import event
+    from models import db
+    from replicas import replica_engines
+
+    seed(app, users=50, addresses_per_user=3, products=50, pictures_per_product=2)
+    with app.app_context():
+        db.engine.dispose()
+        shutil.copy(primary, replica)
+        [replica_engine] = replica_engines(db)
+        engines = {db.engine: 'primary', replica_engine: 'replica'}
+    served = Counter()
+    for engine, name in engines.items():
+        event.listen(engine, 'before_cursor_execute',
+                     lambda *args, name=name: served.update([name]))
+
+    writer, reader = app.test_client(), app.test_client()
+    token = app.test_client().post('/login', json={
+        "userName": "user1", "email": "user1@example.com", "password": "secret1"}).get_json()['jwt']
+    auth = {'Authorization': 'Bearer %s' % token}
+
+    # a mix of one write for nine reads
+    served.clear()
+    start = time.perf_counter()
+    for n in range(200):
+        client = writer if n % 10 == 0 else reader
+        if n % 10 == 0:
+            assert client.put('/address/%d' % (n % 150 + 1), json={"userCity": "City %d" % n}).status_code == 200
+        else:
+            assert client.get('/user/%d' % (n % 50 + 1), headers=auth).status_code == 200
+    print("200 requests, 1 write in 10: %.1f ms, statements %s" % (
+        (time.perf_counter() - start) * 1000, dict(served)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+CPU cost against bytes saved of compressing the full /user and /product responses at several
+gzip levels (and brotli qualities when the brotli package is installed), then the time of a
+request served plain, compressed on every request and compressed once in the response cache.
+
+    $ python benchmarks/response_compression.py
+"""
+import gzip
+import time
+import zlib
+from common import load_app, seed
+
+USERS = 2000
+PRODUCTS = 2000
+GZIP_LEVELS = [1, 3, 6, 9]
+BROTLI_QUALITIES = [1, 4, 5, 8, 11]
+ROUNDS = 20
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def gzip_level(level):
+    def run(data):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    return run
+
+
+def main():
+    app = load_app()
+    import main as api
+    import compression
+
+    seed(app, users=USERS, addresses_per_user=2, products=PRODUCTS, pictures_per_product=3)
+    client = app.test_client()
+    token = client.post('/login', json={
+        "userName": "user1", "email": "user1@example.com", "password": "secret1"}).get_json()['jwt']
+    bodies = [(url, client.get(url).get_data()) for url in ('/user', '/product')]
+
+    methods = [("gzip %d" % level, gzip_level(level)) for level in GZIP_LEVELS]
+    if compression.brotli is not None:
+        methods += [("brotli %d" % quality, lambda data, q=quality: compression.brotli.compress(data, quality=q))
+                    for quality in BROTLI_QUALITIES]
+    else:
+        print("brotli is not installed, gzip only")
+    for url, body in bodies:
+        print("%s: %d bytes" % (url, len(body)))
+        for name, run in methods:
+            seconds, compressed = best_of(lambda: run(body))
+            print("    %-10s %9d bytes  %5.1f%% of the original  %7.2f ms  %6.1f MB/s" % (
+                name, len(compressed), 100.0 * len(compressed) / len(body), seconds * 1000,
+                len(body) / seconds / 1e6))
+
+    # whole requests, /product goes through the response cache, /user doesn't
+    plain = {'Authorization': 'Bearer %s' % token}
+    compressed = dict(plain, **{'Accept-Encoding': 'gzip'})
+    for url in ('/user', '/product'):
+        assert gzip.decompress(client.get(url, headers=compressed).get_data()) == client.get(url).get_data()
+        for name, headers, precompress in (("plain", plain, False), ("gzip", compressed, False),
+                                           ("gzip, stored compressed", compressed, True)):
+            if url == '/user' and precompress:
+                continue
+            api.CACHE.precompress = precompress
+            api.CACHE.invalidate('product:')
+
+            def requests():
+                size = 0
+                for _ in range(ROUNDS):
+                    size = len(client.get(url, headers=headers).get_data())
+                return size
+
+            seconds, size = best_of(requests, repeat=3)
+            print("%-9s %-24s %7.2f ms per request  %8d bytes" % (url, name, seconds * 1000 / ROUNDS, size))
+    api.CACHE.precompress = True
+
+
+if __name__ == '__main__':
+    main()
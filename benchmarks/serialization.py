@@ -0,0 +1,51 @@
+"""
+Compares the original ORM + serialize() + jsonify path with the RowSerializer path
+on the product collection at 1k, 10k and 100k rows.
+
+    $ python benchmarks/serialization.py
+"""
+import time
+from common import load_app, seed
+
+SIZES = [1000, 10000, 100000]
+REPEAT = 3
+
+
+def best_of(func):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    app = load_app()
+    from flask import jsonify
+    from sqlalchemy.orm import subqueryload
+    from models import db, Product
+    from serializers import PRODUCT, dumps, _stdlib_dumps, JSON_ENCODER
+
+    def orm_path():
+        products = Product.query.options(subqueryload(Product.pictureUrl)).order_by(Product.id).all()
+        jsonify([x.serialize() for x in products]).get_data()
+        db.session.expunge_all()
+
+    def core_path(encode):
+        def run():
+            encode(PRODUCT.fetch(PRODUCT.select().order_by(Product.id), all_rows=True))
+        return run
+
+    print("%8s %14s %14s %14s" % ("rows", "orm+jsonify", "core+stdlib", "core+" + JSON_ENCODER))
+    for size in SIZES:
+        seed(app, products=size, pictures_per_product=1)
+        with app.test_request_context():
+            orm = best_of(orm_path)
+            stdlib = best_of(core_path(_stdlib_dumps))
+            fast = best_of(core_path(dumps))
+        print("%8d %13.3fs %13.3fs %13.3fs" % (size, orm, stdlib, fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Measures how long a fresh worker process takes to import the application, for the serving entry
+point (wsgi.py, create_app(tooling=False)) and for the full app with the migration and swagger
+tooling, and lists the heaviest imports of each with python -X importtime.
+
+    $ python benchmarks/startup.py
+"""
+import os
+import sys
+import subprocess
+from common import SRC
+
+RUNS = 7
+TARGETS = [
+    ("wsgi.py (serving)", "import wsgi"),
+    ("create_app() with tooling", "import main; main.create_app()"),
+]
+TOOLING_MODULES = ('flask_migrate', 'alembic', 'flask_swagger')
+
+
+def measure(code):
+    script = ("import sys, time; start = time.perf_counter(); %s; "
+              "print('%%f|%%s' %% (time.perf_counter() - start, ','.join(m for m in %r if m in sys.modules)))"
+              % (code, TOOLING_MODULES))
+    env = dict(os.environ, DB_CONNECTION_STRING='sqlite://')
+    output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', script], cwd=SRC, env=env)
+    seconds, loaded = output.decode('utf-8').strip().splitlines()[-1].split('|')
+    return float(seconds), loaded
+
+
+def heaviest(code, count=5):
+    env = dict(os.environ, DB_CONNECTION_STRING='sqlite://')
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-X', 'importtime', '-c', code],
+                            cwd=SRC, env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    rows = []
+    for line in result.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        # packages only, their time includes their submodules
+        if '.' not in name and name not in ('wsgi', 'main'):
+            rows.append((int(cumulative_us), name))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    for name, code in TARGETS:
+        timings = []
+        for _ in range(RUNS):
+            seconds, loaded = measure(code)
+            timings.append(seconds)
+        timings.sort()
+        print("%-28s median %7.1f ms   min %7.1f ms   tooling loaded: %s" % (
+            name, timings[len(timings) // 2] * 1000, timings[0] * 1000, loaded or 'none'))
+        print("    heaviest imports: %s" % ', '.join(
+            '%s %.0f ms' % (module, us / 1000.0) for us, module in heaviest(code)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares the write-behind queue with synchronous writes against a SQLite file, the time per
+request, until every write is applied and the commits it took. The behaviour of the queue is
+checked in tests/test_write_behind.py.
+
+    $ python benchmarks/write_behind.py
+"""
+import os
+import time
+import tempfile
+from common import load_app, seed
+
+REQUESTS = 2000
+ASYNC = {'Prefer': 'respond-async'}
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'write_behind.db')
+    app = load_app('sqlite:///' + path)
+    from sqlalchemy import event
+    from models import db
+    import main as api
+
+    seed(app, users=100, addresses_per_user=1, products=100, pictures_per_product=0)
+    client = app.test_client()
+    with app.app_context():
+        engine = db.engine
+    commits = []
+    event.listen(engine, 'commit', lambda conn: commits.append(1))
+
+    def pictures(prefix):
+        return [{"picture_url": "https://example.com/%s/%d.jpg" % (prefix, i), "photos_id": i % 100 + 1}
+                for i in range(REQUESTS)]
+
+    # synchronous baseline
+    del commits[:]
+    start = time.perf_counter()
+    for body in pictures('sync'):
+        assert client.post('/picture', json=body).status_code == 200
+    sync_elapsed = time.perf_counter() - start
+    print("synchronous       %7.3f ms per request   %5d commits" % (
+        sync_elapsed * 1000 / REQUESTS, len(commits)))
+
+    # queued, the time until every write is applied is what the rows cost
+    del commits[:]
+    start = time.perf_counter()
+    for body in pictures('async'):
+        response = client.post('/picture', json=body, headers=ASYNC)
+        assert response.status_code == 202, response.status_code
+    accepted = time.perf_counter() - start
+    wait_until(lambda: api.WRITES.stats()['applied'] >= REQUESTS)
+    applied = time.perf_counter() - start
+    print("respond-async     %7.3f ms per request   %5d commits   all applied after %.3f ms per request" % (
+        accepted * 1000 / REQUESTS, len(commits), applied * 1000 / REQUESTS))
+    print(api.WRITES.stats())
+
+
+def wait_until(condition, timeout=60):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise RuntimeError('timed out')
+        time.sleep(0.01)
+
+
+if __name__ == '__main__':
+    main()
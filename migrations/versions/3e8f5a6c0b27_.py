@@ -0,0 +1,30 @@
+"""add foreign key and login indexes
+
+Revision ID: 3e8f5a6c0b27
+Revises: 9b1c2d7e4a10
+Create Date: 2026-10-18 11:03:54.219874
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8f5a6c0b27'
+down_revision = '9b1c2d7e4a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_addresses_person_id'), 'addresses', ['person_id'], unique=False)
+    op.create_index(op.f('ix_billing_addresses_person_id'), 'billing_addresses', ['person_id'], unique=False)
+    op.create_index(op.f('ix_pictures_photos_id'), 'pictures', ['photos_id'], unique=False)
+    op.create_index('ix_users_userName_email', 'users', ['userName', 'email'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_users_userName_email', table_name='users')
+    op.drop_index(op.f('ix_pictures_photos_id'), table_name='pictures')
+    op.drop_index(op.f('ix_billing_addresses_person_id'), table_name='billing_addresses')
+    op.drop_index(op.f('ix_addresses_person_id'), table_name='addresses')
@@ -0,0 +1,83 @@
+"""convert productPrice to a numeric column
+
+Revision ID: 5a7e0c3b9d14
+Revises: c41d9e2f7b58
+Create Date: 2026-10-18 12:31:47.118203
+
+"""
+import logging
+from decimal import Decimal, InvalidOperation
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7e0c3b9d14'
+down_revision = 'c41d9e2f7b58'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+products = sa.table(
+    'products',
+    sa.column('id', sa.Integer),
+    sa.column('productPrice', sa.String(45)),
+    sa.column('productPriceNumeric', sa.Numeric(10, 2)),
+)
+
+
+def parse_price(value):
+    # prices were free text, keep what reads as a price that fits Numeric(10, 2), None for the rest
+    try:
+        price = Decimal(str(value).strip().lstrip('$').replace(',', '')).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return None
+    return price if 0 <= price < 10 ** 8 else None
+
+
+def upgrade():
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(products.c.id, products.c.productPrice)).fetchall()
+    prices = [(row_id, price, parse_price(price)) for row_id, price in rows]
+    # checked before any change, sqlite can't roll DDL back
+    invalid = ['products.id %s: %r' % (row_id, price) for row_id, price, parsed in prices if parsed is None]
+    if invalid:
+        message = '%d prices are not a number between 0 and 99999999.99, fix them and run the migration again:\n%s' % (
+            len(invalid), '\n'.join(invalid))
+        # flask db doesn't print the exception, alembic's logger is the one configured
+        logger.error(message)
+        raise RuntimeError(message)
+
+    op.add_column('products', sa.Column('productPriceNumeric', sa.Numeric(10, 2), nullable=True))
+    if prices:
+        conn.execute(
+            products.update().where(products.c.id == sa.bindparam('row_id'))
+            .values(productPriceNumeric=sa.bindparam('price')),
+            [{'row_id': row_id, 'price': parsed} for row_id, price, parsed in prices])
+
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_column('productPrice')
+        batch_op.alter_column('productPriceNumeric', new_column_name='productPrice',
+                              existing_type=sa.Numeric(10, 2), nullable=False)
+    op.create_index(op.f('ix_products_productPrice'), 'products', ['productPrice'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_products_productPrice'), table_name='products')
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.alter_column('productPrice', new_column_name='productPriceNumeric',
+                              existing_type=sa.Numeric(10, 2), nullable=True)
+    op.add_column('products', sa.Column('productPrice', sa.String(length=45), nullable=True))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(products.c.id, products.c.productPriceNumeric)).fetchall()
+    if rows:
+        conn.execute(
+            products.update().where(products.c.id == sa.bindparam('row_id'))
+            .values(productPrice=sa.bindparam('price')),
+            [{'row_id': row_id, 'price': str(price)} for row_id, price in rows])
+
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_column('productPriceNumeric')
+        batch_op.alter_column('productPrice', existing_type=sa.String(length=45), nullable=False)
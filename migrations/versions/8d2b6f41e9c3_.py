@@ -0,0 +1,30 @@
+"""widen users.password to hold password hashes
+
+Revision ID: 8d2b6f41e9c3
+Revises: 5a7e0c3b9d14
+Create Date: 2026-10-18 13:02:19.440871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2b6f41e9c3'
+down_revision = '5a7e0c3b9d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing plain text passwords stay as they are, they are hashed on the next login
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('password', existing_type=sa.String(length=45),
+                              type_=sa.String(length=255), existing_nullable=False)
+
+
+def downgrade():
+    # hashes don't fit in 45 characters, this fails once any user has logged in
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('password', existing_type=sa.String(length=255),
+                              type_=sa.String(length=45), existing_nullable=False)
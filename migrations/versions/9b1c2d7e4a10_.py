@@ -0,0 +1,29 @@
+"""add row version columns
+
+Revision ID: 9b1c2d7e4a10
+Revises: f3d7df680a11
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1c2d7e4a10'
+down_revision = 'f3d7df680a11'
+branch_labels = None
+depends_on = None
+
+TABLES = ['users', 'products', 'addresses', 'billing_addresses', 'pictures']
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,50 @@
+"""delete addresses, billing addresses and pictures with their user or product
+
+Revision ID: a6c3f0d2b871
+Revises: 8d2b6f41e9c3
+Create Date: 2026-10-18 15:21:47.205339
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c3f0d2b871'
+down_revision = '8d2b6f41e9c3'
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEYS = [
+    ('addresses', 'person_id', 'users'),
+    ('billing_addresses', 'person_id', 'users'),
+    ('pictures', 'photos_id', 'products'),
+]
+# sqlite doesn't name the constraints of the first migration, batch mode names them after this
+NAMING = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def foreign_key_name(table, column, referred):
+    # mysql and postgres named them when the tables were created
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys(table):
+        if fk['constrained_columns'] == [column] and fk['name']:
+            return fk['name']
+    return NAMING['fk'] % {'table_name': table, 'column_0_name': column, 'referred_table_name': referred}
+
+
+def replace_foreign_key(table, column, referred, ondelete):
+    name = foreign_key_name(table, column, referred)
+    with op.batch_alter_table(table, naming_convention=NAMING) as batch_op:
+        batch_op.drop_constraint(name, type_='foreignkey')
+        batch_op.create_foreign_key('fk_%s_%s_%s' % (table, column, referred), referred,
+                                    [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    for table, column, referred in FOREIGN_KEYS:
+        replace_foreign_key(table, column, referred, 'CASCADE')
+
+
+def downgrade():
+    for table, column, referred in reversed(FOREIGN_KEYS):
+        replace_foreign_key(table, column, referred, None)
@@ -0,0 +1,35 @@
+"""add indexes for collection filters
+
+Revision ID: c41d9e2f7b58
+Revises: 3e8f5a6c0b27
+Create Date: 2026-10-18 11:46:08.730512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d9e2f7b58'
+down_revision = '3e8f5a6c0b27'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('users', 'userLastName'),
+    ('products', 'productCategory'),
+    ('products', 'productAgeRange'),
+    ('addresses', 'userCity'),
+    ('addresses', 'userState'),
+    ('addresses', 'userZipCode'),
+]
+
+
+def upgrade():
+    for table, column in INDEXES:
+        op.create_index(op.f('ix_%s_%s' % (table, column)), table, [column], unique=False)
+
+
+def downgrade():
+    for table, column in reversed(INDEXES):
+        op.drop_index(op.f('ix_%s_%s' % (table, column)), table_name=table)
@@ -0,0 +1,32 @@
+"""add per table change counters
+
+Revision ID: e2b9c4d7a315
+Revises: a6c3f0d2b871
+Create Date: 2026-10-19 09:14:05.633870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b9c4d7a315'
+down_revision = 'a6c3f0d2b871'
+branch_labels = None
+depends_on = None
+
+TABLES = ['users', 'products', 'addresses', 'billing_addresses', 'pictures']
+
+
+def upgrade():
+    table_changes = op.create_table('table_changes',
+        sa.Column('table_name', sa.String(length=45), nullable=False),
+        sa.Column('changes', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('deletes', sa.BigInteger(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(table_changes, [{'table_name': table, 'changes': 0, 'deletes': 0} for table in TABLES])
+
+
+def downgrade():
+    op.drop_table('table_changes')
@@ -0,0 +1,114 @@
+# This file runs the same application under an ASGI server (pip install uvicorn), next to wsgi.py for gunicorn.
+# Every request runs the regular flask view on a bounded thread pool, each thread with its own
+# db session, so one process can wait on many slow queries at the same time.
+#
+#   $ uvicorn asgi:application --app-dir ./src/
+#   $ gunicorn asgi --chdir ./src/ -k uvicorn.workers.UvicornWorker
+#
+# ASGI_THREADS sets how many requests run at once, keep DB_POOL_SIZE + DB_MAX_OVERFLOW at least as big.
+
+import os
+import sys
+import asyncio
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from main import create_app
+
+
+class ThreadedWSGI(object):
+    """
+    ASGI adapter that runs a WSGI app on a thread pool
+    """
+
+    def __init__(self, wsgi_app, workers):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asgi-worker')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported scope type %s' % scope['type'])
+
+        body = BytesIO()
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        await loop.run_in_executor(self.executor, self.run, build_environ(scope, body), send_from_thread)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # let the requests in flight finish before the process exits
+                await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def run(self, environ, send):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]
+
+        def send_start():
+            if not response.get('started'):
+                response['started'] = True
+                send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                send_start()
+                if chunk:
+                    send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_start()
+            send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope['http_version'],
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+
+application = ThreadedWSGI(create_app(tooling=False), workers=int(os.environ.get('ASGI_THREADS', 32)))
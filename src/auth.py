@@ -0,0 +1,59 @@
+"""
+Cached token verification for the routes behind a JWT.
+Verified tokens are kept in a bounded LRU cache keyed by the hash of the token until their exp claim,
+so a client sending the same token again skips the signature check.
+"""
+import os
+import time
+import hashlib
+from functools import wraps
+from flask import request
+from flask_jwt_simple.config import config
+from flask_jwt_simple.utils import decode_jwt, ctx_stack
+from flask_jwt_simple.exceptions import InvalidHeaderError, NoAuthorizationError
+from cache import LRUCache
+
+# how many verified tokens are kept, and how long one is trusted before its signature
+# is checked again even if it did not expire
+TOKENS = LRUCache(int(os.environ.get('AUTH_CACHE_SIZE', 10000)), ttl=int(os.environ.get('AUTH_CACHE_TTL', 300)))
+
+
+def token_from_headers():
+    # same header checks as flask_jwt_simple
+    header = request.headers.get(config.header_name, None)
+    if not header:
+        raise NoAuthorizationError("Missing {} Header".format(config.header_name))
+    parts = header.split()
+    if not config.header_type:
+        if len(parts) != 1:
+            raise InvalidHeaderError("Bad {} header. Expected value '<JWT>'".format(config.header_name))
+        return parts[0]
+    if parts[0] != config.header_type or len(parts) != 2:
+        raise InvalidHeaderError("Bad {} header. Expected value '{} <JWT>'".format(
+            config.header_name, config.header_type))
+    return parts[1]
+
+
+def verify_token(token):
+    """
+    Returns the claims of the token, decoding and checking the signature only if it isn't cached.
+    An invalid or expired token raises the same errors as flask_jwt_simple.
+    """
+    key = hashlib.sha256(token.encode('utf8')).hexdigest()
+    claims = TOKENS.get(key)
+    if claims is not None and claims.get('exp', float('inf')) > time.time():
+        return claims
+    claims = decode_jwt(encoded_token=token)
+    TOKENS.set(key, claims)
+    return claims
+
+
+def jwt_required(fn):
+    """
+    Drop-in for flask_jwt_simple.jwt_required, get_jwt() and get_jwt_identity() keep working in the view
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        ctx_stack.top.jwt = verify_token(token_from_headers())
+        return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,262 @@
+"""
+Response cache for read heavy endpoints.
+Entries are keyed on the table change counters @conditional reads for the request, so a write
+committed by any process makes the entries built before it unreachable. The entries of the writes
+made by this process are also dropped from SQLAlchemy events, which frees them right away.
+"""
+import os
+import time
+import sqlite3
+import tempfile
+import itertools
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, Response, current_app, g
+from sqlalchemy import inspect
+from models import Product, Picture
+from replicas import after_replication
+from changes import track_writes
+from compression import negotiate, compress, COMPRESSIBLE, MIN_SIZE
+
+
+class LRUCache(object):
+    """
+    In process backend, least recently used entries are dropped once maxsize is reached
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SharedCache(object):
+    """
+    Backend stored in a sqlite file so every worker process on the same host shares
+    the entries and sees the invalidations made by the others.
+    Expired entries are deleted every purge_every writes.
+    """
+
+    def __init__(self, path=None, ttl=60, purge_every=1000):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'api_response_cache.db')
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._writes = itertools.count(1)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                         '(key TEXT PRIMARY KEY, body BLOB, status INTEGER, mimetype TEXT, expires REAL)')
+
+    def _connect(self):
+        # one connection per thread, a forked worker opens its own instead of using the copy of its parent's
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute('SELECT body, status, mimetype, expires FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None or row[3] < time.time():
+            return None
+        return row[0], row[1], row[2]
+
+    def set(self, key, value):
+        body, status, mimetype = value
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)',
+                         (key, body, status, mimetype, time.time() + self.ttl))
+            if next(self._writes) % self.purge_every == 0:
+                conn.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_prefix(self, prefix):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM cache')
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT count(*) FROM cache').fetchone()[0]
+
+
+class ResponseCache(object):
+    """
+    Caches successful GET responses keyed on a namespace plus the query args
+    and keeps hit/miss counters for this process.
+    With precompress the compressed body is stored next to the plain one, under the key plus
+    the encoding, so a hot response is compressed once and not on every hit.
+    """
+
+    def __init__(self, backend=None, precompress=True):
+        self.backend = backend
+        self.precompress = precompress
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, namespace):
+        """
+        Decorator for a view, namespace is formatted with the view arguments,
+        for example 'product:%(product_id)s'. Goes under @conditional, the state it reads
+        is part of the key.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None or request.method != 'GET':
+                    return view(*args, **kwargs)
+
+                key = make_key(namespace % kwargs, g.get('etag_state'))
+                encoding = negotiate() if self.precompress else None
+                if encoding is not None:
+                    entry = self.backend.get(key + '#' + encoding)
+                    if entry is not None:
+                        self.hits += 1
+                        body, status, mimetype = entry
+                        return Response(body, status=status, mimetype=mimetype,
+                                        headers={'X-Cache': 'HIT', 'Content-Encoding': encoding})
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    response = Response(entry[0], status=entry[1], mimetype=entry[2], headers={'X-Cache': 'HIT'})
+                    return self.store_compressed(key, entry, encoding, response)
+
+                self.misses += 1
+                response = current_app.make_response(view(*args, **kwargs))
+                response.headers['X-Cache'] = 'MISS'
+                if response.status_code == 200 and not response.is_streamed:
+                    entry = (response.get_data(), response.status_code, response.mimetype)
+                    self.backend.set(key, entry)
+                    return self.store_compressed(key, entry, encoding, response)
+                return response
+            return wrapper
+        return decorator
+
+    def store_compressed(self, key, entry, encoding, response):
+        """
+        Stores the compressed variant of an entry and answers with it, when it is worth compressing
+        """
+        body, status, mimetype = entry
+        if encoding is None or len(body) < MIN_SIZE or mimetype not in COMPRESSIBLE:
+            return response
+        compressed = compress(body, encoding)
+        if len(compressed) >= len(body):
+            return response
+        self.backend.set(key + '#' + encoding, (compressed, status, mimetype))
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def invalidate(self, namespace):
+        """
+        Drops the entries of a namespace, a namespace ending in ':' drops all the entries under it
+        """
+        if self.backend is not None:
+            self.backend.delete_prefix(namespace if namespace.endswith(':') else namespace + '|')
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "entries": len(self.backend) if self.backend is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": float(self.hits) / total if total else 0.0
+        }
+
+
+def make_key(namespace, state=None):
+    args = '&'.join('%s=%s' % item for item in sorted(request.args.items(multi=True)))
+    return '%s|%s|%s' % (namespace, args, ','.join(map(str, state or ())))
+
+
+def cache_from_env():
+    """
+    RESPONSE_CACHE selects the backend: memory (default), shared or none
+    """
+    kind = os.environ.get('RESPONSE_CACHE', 'memory')
+    ttl = int(os.environ.get('RESPONSE_CACHE_TTL', 60))
+    # RESPONSE_CACHE_PRECOMPRESS=false stores only the plain bodies
+    precompress = os.environ.get('RESPONSE_CACHE_PRECOMPRESS', 'true').lower() in ('1', 'true', 'yes')
+    if kind == 'none':
+        return ResponseCache(None)
+    if kind == 'shared':
+        return ResponseCache(SharedCache(os.environ.get('RESPONSE_CACHE_PATH'), ttl=ttl), precompress)
+    return ResponseCache(LRUCache(int(os.environ.get('RESPONSE_CACHE_SIZE', 1024)), ttl=ttl), precompress)
+
+
+# ////////////////////////////////////////// Invalidation //////////////////////////////////////////
+
+def stale_namespaces(target):
+    """
+    Namespaces whose cached responses include this product or picture
+    """
+    if isinstance(target, Product):
+        return {'product:list', 'product:stats', 'product:%s' % target.id}
+    ids = {target.photos_id}
+    # a picture moved to another product makes both products stale
+    ids.update(inspect(target).attrs.photos_id.history.deleted or ())
+    return {'product:list'} | {'product:%s' % i for i in ids}
+
+
+def register_invalidation(cache):
+    """
+    Drops the cached product responses when a Product or Picture changes.
+    Changes are collected while flushing and applied once the transaction commits,
+    when the new data is visible to the other requests.
+    """
+    def on_row(namespaces, target, deleted):
+        namespaces.update(dict.fromkeys(stale_namespaces(target)))
+
+    def on_statement(namespaces, table, deleted):
+        # statements like bulk inserts don't say which rows they touched
+        namespaces['product:'] = None
+
+    def on_commit(session, namespaces):
+        after_replication(lambda: [cache.invalidate(namespace) for namespace in namespaces])
+
+    track_writes('response_cache', (Product, Picture), on_row, on_statement, on_commit)
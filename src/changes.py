@@ -0,0 +1,58 @@
+"""
+Collects what the writes of a transaction change, for the caches and counters kept next to the tables.
+The ORM writes are seen row by row through the mapper events, the statements run with
+session.execute() (bulk inserts, bulk deletes, PATCH) only tell their table. What was collected
+is kept in session.info until the transaction commits, and dropped if it rolls back.
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+def track_writes(name, models, row, statement, commit, before_commit=False):
+    """
+    row(changes, target, deleted) is called for every row of models the ORM inserts, updates or deletes,
+    statement(changes, table, deleted) for the insert, update and delete statements on their tables,
+    changes is a dict kept for the transaction. commit(session, changes) is called once the transaction
+    committed, or with before_commit right before the commit, still in the transaction.
+    """
+    key = 'changes:%s' % name
+    tables = set(model.__table__ for model in models)
+
+    def changes_of(session):
+        return session.info.setdefault(key, {})
+
+    def on_row(deleted):
+        def listener(mapper, connection, target):
+            session = Session.object_session(target)
+            if session is not None:
+                row(changes_of(session), target, deleted)
+        return listener
+
+    for model in models:
+        event.listen(model, 'after_insert', on_row(False))
+        event.listen(model, 'after_update', on_row(False))
+        event.listen(model, 'after_delete', on_row(True))
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def on_execute(state):
+        if (state.is_insert or state.is_update or state.is_delete) and state.statement.table in tables:
+            statement(changes_of(state.session), state.statement.table, state.is_delete)
+
+    if before_commit:
+        @event.listens_for(Session, 'before_commit')
+        def on_before_commit(session):
+            # commit() flushes after this event, what it would flush has to be collected now
+            session.flush()
+            changes = session.info.pop(key, None)
+            if changes:
+                commit(session, changes)
+    else:
+        @event.listens_for(Session, 'after_commit')
+        def on_commit(session):
+            changes = session.info.pop(key, None)
+            if changes:
+                commit(session, changes)
+
+    @event.listens_for(Session, 'after_rollback')
+    def on_rollback(session):
+        session.info.pop(key, None)
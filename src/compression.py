@@ -0,0 +1,121 @@
+"""
+Response compression negotiated from Accept-Encoding.
+Brotli is used when the brotli package is installed and the client accepts it, gzip otherwise.
+Bodies under COMPRESSION_MIN_SIZE bytes go out as they are, streamed responses are compressed
+chunk by chunk and flushed after each chunk so they keep streaming. The ETag of a compressed
+response gets the encoding appended, a cache must not serve the gzip bytes under the ETag
+of the plain ones, see matched_etag() for the If-None-Match side.
+"""
+import os
+import zlib
+from flask import request
+from profiling import phase
+from serializers import to_bytes
+
+# COMPRESSION=none turns it off, COMPRESSION=gzip leaves brotli out even if it's installed
+try:
+    if os.environ.get('COMPRESSION', 'auto') in ('none', 'gzip'):
+        raise ImportError
+    import brotli
+except ImportError:
+    brotli = None
+
+ENABLED = os.environ.get('COMPRESSION', 'auto') != 'none'
+MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+COMPRESSIBLE = {'application/json', 'application/x-ndjson', 'text/html', 'text/plain', 'text/css',
+                'application/javascript'}
+
+
+def negotiate():
+    """
+    Encoding to use for the current request or None
+    """
+    if not ENABLED:
+        return None
+    accepted = request.accept_encodings
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accepted[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding):
+    with phase('compress'):
+        if encoding == 'br':
+            return brotli.compress(data, quality=BROTLI_QUALITY)
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compresses an iterable of chunks, each chunk is flushed so the client gets it right away
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(to_bytes(chunk)) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(to_bytes(chunk)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def compressible(response):
+    return (ENABLED and response.status_code == 200 and not response.direct_passthrough
+            and response.mimetype in COMPRESSIBLE)
+
+
+def matched_etag(etag):
+    """
+    The variant of etag found in If-None-Match, the plain one or one with an encoding
+    the request accepts appended, or None
+    """
+    if etag in request.if_none_match:
+        return etag
+    for encoding in ENCODINGS:
+        if request.accept_encodings[encoding] and '%s-%s' % (etag, encoding) in request.if_none_match:
+            return '%s-%s' % (etag, encoding)
+    return None
+
+
+def init_compression(app):
+    @app.after_request
+    def compress_response(response):
+        if not compressible(response):
+            return response
+        # the body depends on the header even when this one isn't compressed
+        response.vary.add('Accept-Encoding')
+        # set by the response cache when it had the compressed body stored
+        encoding = response.headers.get('Content-Encoding')
+        if encoding is None:
+            encoding = negotiate()
+            if encoding is None:
+                return response
+            if response.is_streamed:
+                response.response = compress_stream(response.response, encoding)
+                response.headers.pop('Content-Length', None)
+            else:
+                data = response.get_data()
+                if len(data) < MIN_SIZE:
+                    return response
+                compressed = compress(data, encoding)
+                if len(compressed) >= len(data):
+                    return response
+                response.set_data(compressed)
+            response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag('%s-%s' % (etag, encoding), weak)
+        return response
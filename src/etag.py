@@ -0,0 +1,111 @@
+"""
+Conditional GET support.
+ETags are built from per table change counters and the row version columns with small queries,
+so a 304 can be answered without loading or serializing the resource.
+Every transaction that writes to a table bumps its counter in table_changes right before it
+commits, ORM flushes and Core statements run through the session alike. The counters only go up,
+unlike aggregates over the rows, which come back to earlier values when an id is reused.
+"""
+import hashlib
+from functools import wraps
+from flask import request, current_app, g
+from sqlalchemy import select, case
+from models import db, TableChange, counted_tables
+from compression import matched_etag
+from changes import track_writes
+
+
+def counter(name, column='changes'):
+    return select(getattr(TableChange, column)).where(TableChange.table_name == name).scalar_subquery()
+
+
+def collection_state(*models):
+    """
+    Change counters of the tables a collection response is built from, in one round trip
+    """
+    return tuple(db.session.execute(select(*[counter(m.__tablename__) for m in models])).one())
+
+
+def table_counters(model):
+    """
+    (changes, deletes) of the table of a model
+    """
+    name = model.__tablename__
+    return tuple(db.session.execute(select(counter(name), counter(name, 'deletes'))).one())
+
+
+def resource_state(model, ident, children=()):
+    """
+    State of a single row plus the child rows serialize() nests in it.
+    children lists the foreign key columns pointing to the row, returns None if the row doesn't exist.
+    The deletes counter of the table tells a row apart from an earlier one that had the same id.
+    """
+    counters = [counter(model.__tablename__, 'deletes')] + [counter(fk.class_.__tablename__) for fk in children]
+    return db.session.execute(select(model.version, *counters).where(model.id == ident)).first()
+
+
+def cascaded(table):
+    """
+    Tables the database deletes rows from along with a row of table (ON DELETE CASCADE)
+    """
+    tables = []
+    for child in counted_tables():
+        if any(fk.ondelete == 'CASCADE' and fk.column.table is table for fk in child.foreign_keys):
+            tables.append(child)
+            tables.extend(cascaded(child))
+    return tables
+
+
+def register_change_counters():
+    """
+    Bumps the counters of the tables a transaction wrote to, in the transaction itself
+    """
+    def on_statement(changed, table, deleted):
+        for name in [table.name] + ([child.name for child in cascaded(table)] if deleted else []):
+            changed[name] = changed.get(name, False) or deleted
+
+    def on_row(changed, target, deleted):
+        on_statement(changed, target.__table__, deleted)
+
+    def on_commit(session, changed):
+        table = TableChange.__table__
+        deleted = [name for name, was_deleted in changed.items() if was_deleted]
+        # one statement for every counter, the row locks are held only until the commit that follows
+        session.execute(table.update().where(table.c.table_name.in_(sorted(changed))).values(
+            changes=table.c.changes + 1,
+            deletes=table.c.deletes + case((table.c.table_name.in_(deleted), 1), else_=0)))
+
+    models = [mapper.class_ for mapper in db.Model.registry.mappers if mapper.class_ is not TableChange]
+    track_writes('table_changes', models, on_row, on_statement, on_commit, before_commit=True)
+
+
+def conditional(state):
+    """
+    Decorator that adds an ETag to GET responses and answers If-None-Match with a 304.
+    state receives the view arguments and returns the values the ETag is built from.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            values = state(**kwargs)
+            if values is None:
+                return view(*args, **kwargs)
+            # the response cache keys its entries on it, see ResponseCache.cached
+            g.etag_state = tuple(values)
+
+            # the query args change the representation, e.g. pagination
+            etag = hashlib.sha1(repr((request.full_path, g.etag_state)).encode('utf-8')).hexdigest()
+            matched = matched_etag(etag)
+            if matched is not None:
+                # the client may hold the compressed variant, answer with the ETag it sent
+                response = current_app.response_class(status=304)
+                response.set_etag(matched)
+                return response
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
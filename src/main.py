@@ -1,35 +1,96 @@
 """
-This module takes care of starting the API Server, Loading the DB and Adding the endpoints
+This module takes care of starting the API Server, Loading the DB and Adding the endpoints.
+The endpoints live on the api blueprint, create_app() builds the application around it.
 """
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+import time
+from flask import Flask, Blueprint, request, jsonify, current_app
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from models import db, User, Product, Address, BillingAddress, Picture
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError, DataError
+from sqlalchemy.orm.exc import StaleDataError
+from utils import (APIException, Sitemap, collection_response, bulk_create, bulk_delete, patch_response,
+                   parse_decimal, check_value)
+from models import db, User, Product, Address, BillingAddress, Picture, enable_sqlite_foreign_keys
+from cache import cache_from_env, register_invalidation
+from etag import conditional, collection_state, resource_state, register_change_counters
+from pool import engine_options_from_env, pool_stats, dispose_after_fork
+from profiling import init_profiling
+from search import ProductIndex, register_search_index, MAX_SEARCH_RESULTS
+from stats import price_stats, MIN_BUCKET
+from auth import jwt_required
+from passwords import hash_password, verify_password, dummy_hash
+from writebehind import write_queue_from_env, QueueFull
+from replicas import REPLICA_URLS, replica_binds, replica_engines, init_replicas
+from compression import init_compression
 
 from flask_jwt_simple import (
-    JWTManager, jwt_required, create_jwt, get_jwt_identity
+    JWTManager, create_jwt
 )
 
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DB_CONNECTION_STRING')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
+api = Blueprint('api', __name__)
+register_change_counters()
+CACHE = cache_from_env()
+register_invalidation(CACHE)
+SEARCH_INDEX = ProductIndex()
+register_search_index(SEARCH_INDEX)
+# Prefer: respond-async on POST /picture and PUT /address/<id> queues the write, see writebehind.py
+WRITES = write_queue_from_env()
 
-# /////////////////////////////////////// JWT configuration///////////////////////////////////////
-# Setup the Flask-JWT-Simple extension
-app.config['JWT_SECRET_KEY'] = 'super-secret'  # Change this!
-jwt = JWTManager(app)
+
+def create_app(tooling=True):
+    """
+    Builds the application. tooling adds flask-migrate, needed by the flask db commands, and the
+    swagger spec on /spec, serving requests needs neither and wsgi.py leaves them out.
+    """
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DB_CONNECTION_STRING')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env(app.config['SQLALCHEMY_DATABASE_URI'])
+    if REPLICA_URLS:
+        app.config['SQLALCHEMY_BINDS'] = replica_binds()
+        init_replicas(app)
+    db.init_app(app)
+    enable_sqlite_foreign_keys(app)
+    CORS(app)
+
+    # /////////////////////////////////////// JWT configuration///////////////////////////////////////
+    # Setup the Flask-JWT-Simple extension
+    app.config['JWT_SECRET_KEY'] = 'super-secret'  # Change this!
+    JWTManager(app)
+
+    app.register_blueprint(api)
+    WRITES.init_app(app)
+    if os.environ.get('PROFILING'):
+        init_profiling(app)
+    # registered after profiling so its after_request runs first and the compress phase is timed
+    init_compression(app)
+    if tooling:
+        init_tooling(app)
+    # once every route is registered
+    app.extensions['sitemap'] = Sitemap(app)
+    # with gunicorn --preload the workers are forked from a process that may hold connections
+    dispose_after_fork(app, db)
+    return app
+
+
+def init_tooling(app):
+    # imported here, flask-migrate loads alembic and flask-swagger a yaml parser
+    from flask_migrate import Migrate
+    from flask_swagger import swagger
+
+    Migrate(app, db)
+
+    # on the app, the api blueprint is already registered
+    def spec():
+        return jsonify(swagger(app)), 200
+    app.add_url_rule('/spec', 'spec', spec, methods=['GET'])
 
 
 # Provide a method to create access tokens. The create_jwt()
 # function is used to actually generate the token
-@app.route('/login', methods=['POST'])
+@api.route('/login', methods=['POST'])
 def login():
     if not request.is_json:
         return jsonify({"msg": "Missing JSON in request"}), 400
@@ -37,32 +98,121 @@ def login():
     params = request.get_json()
     userName = params.get('userName', None)
     email = params.get('email', None)
+    password = params.get('password', None)
 
     if not userName:
         return jsonify({"msg": "Missing username parameter"}), 400
     if not email:
+        return jsonify({"msg": "Missing email parameter"}), 400
+    if not password:
         return jsonify({"msg": "Missing password parameter"}), 400
     usercheck = User.query.filter_by(userName=userName, email=email).first()
-    if usercheck == None:
-        return jsonify({"msg": "Bad username or email"}), 401
-    # if username != 'test' or password != 'test':
-    #     return jsonify({"msg": "Bad username or password"}), 401
+    stored = usercheck.password if usercheck is not None else dummy_hash()
+    # give the connection back to the pool while the password is hashed
+    db.session.commit()
+    matches, needs_rehash = verify_password(password, stored)
+    if usercheck is None or not matches:
+        return jsonify({"msg": "Bad username, email or password"}), 401
+    if needs_rehash:
+        usercheck.password = hash_password(password)
+        db.session.commit()
 
     # Identity can be any data that is json serializable
     ret = {'jwt': create_jwt(identity=userName)}
     return jsonify(ret), 200
 
-@app.errorhandler(APIException)
+@api.app_errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
-@app.route('/')
+@api.app_errorhandler(StaleDataError)
+def handle_concurrent_update(error):
+    # the row changed (version column) or was deleted between reading and writing it
+    db.session.rollback()
+    return jsonify({"message": "The resource was changed by another request, try again"}), 409
+
+@api.app_errorhandler(DataError)
+def handle_invalid_value(error):
+    # a value the database refuses for its column, like a number out of range
+    db.session.rollback()
+    return jsonify({"message": "A value doesn't fit its column: %s" % (getattr(error, 'orig', None) or error)}), 400
+
+@api.app_errorhandler(QueueFull)
+def handle_queue_full(error):
+    response = jsonify({"message": str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def accepted(tracking_id):
+    response = jsonify({"trackingId": tracking_id, "status": "queued"})
+    response.status_code = 202
+    response.headers['Location'] = '/writes/%s' % tracking_id
+    return response
+
+@api.route('/')
 def sitemap():
-    return generate_sitemap(app)
+    return current_app.extensions['sitemap'].response()
+
+@api.route('/sitemap.json', methods=['GET'])
+def sitemap_json():
+    return current_app.extensions['sitemap'].response('application/json')
+
+@api.route('/health', methods=['GET'])
+def health():
+    """
+    Liveness check for probes, it doesn't touch the database unless asked with ?deep=1
+    """
+    if request.args.get('deep') not in ('1', 'true'):
+        response = jsonify({"status": "ok"})
+    else:
+        start = time.perf_counter()
+        try:
+            db.session.execute(text('SELECT 1'))
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            response = jsonify({"status": "error", "database": type(error).__name__})
+            response.status_code = 503
+        else:
+            response = jsonify({"status": "ok", "database": "ok",
+                                "databaseMs": round((time.perf_counter() - start) * 1000, 3)})
+    response.cache_control.no_store = True
+    return response
+
+@api.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(CACHE.stats()), 200
+
+@api.route('/pool/stats', methods=['GET'])
+def connection_pool_stats():
+    stats = pool_stats(db.engine)
+    replicas = replica_engines(db)
+    if replicas:
+        stats["replicas"] = [dict(pool_stats(engine), url=engine.url.render_as_string(hide_password=True))
+                             for engine in replicas]
+    return jsonify(stats), 200
+
+@api.route('/writes/stats', methods=['GET'])
+def write_queue_stats():
+    return jsonify(WRITES.stats()), 200
+
+@api.route('/writes/<tracking_id>', methods=['GET'])
+def write_status(tracking_id):
+    """
+    Outcome of a write queued with Prefer: respond-async, queued, done or failed
+    """
+    status = WRITES.status(tracking_id)
+    if status is None:
+        raise APIException('Unknown tracking id', status_code=404)
+    body, code, mimetype = status
+    response = current_app.response_class(body, status=code, mimetype=mimetype)
+    response.cache_control.no_store = True
+    return response
 
     # //////////////////////////// Create Person Endpoints //////////////////////////////////////////////////
 
-@app.route('/user', methods=['POST', 'GET'])
+@api.route('/user', methods=['POST', 'GET'])
+@conditional(lambda: collection_state(User, Address, BillingAddress))
 def handle_person():
     """
     Create person and retrieve all persons
@@ -81,22 +231,23 @@ def handle_person():
         if 'password' not in body:
             raise APIException('You need to enter your password', status_code=400)
 
-        user1 = User(userFirstName=body['userFirstName'], userLastName=body['userLastName'], userName=body['userName'], email=body['email'], password=body['password'], addresses=body['addresses'])
+        user1 = User(userFirstName=body['userFirstName'], userLastName=body['userLastName'], userName=body['userName'], email=body['email'], password=hash_password(body['password']), addresses=body['addresses'])
         db.session.add(user1)
         db.session.commit()
         return "ok", 200
 
     # GET request
     if request.method == 'GET':
-        all_people = User.query.all()
-        all_people = list(map(lambda x: x.serialize(), all_people))
-        return jsonify(all_people), 200
+        return collection_response(User,
+                                   filters=[User.userName, User.email, User.userLastName],
+                                   sorts=[User.userName, User.userLastName, User.email])
 
     return "Invalid Method", 404
 
 
-@app.route('/user/<int:person_id>', methods=['PUT', 'GET', 'DELETE'])
+@api.route('/user/<int:person_id>', methods=['PUT', 'PATCH', 'GET', 'DELETE'])
 @jwt_required #this decorator makes this requires to be logged in
+@conditional(lambda person_id: resource_state(User, person_id, [Address.person_id, BillingAddress.person_id]))
 def get_single_person(person_id):
     """
     Single person
@@ -120,6 +271,10 @@ def get_single_person(person_id):
 
         return jsonify(user1.serialize()), 200
 
+    # PATCH request, only the fields sent are changed
+    if request.method == 'PATCH':
+        return patch_response(User, person_id, [User.userFirstName, User.userLastName, User.userName, User.email])
+
     # GET request
     if request.method == 'GET':
         user1 = User.query.get(person_id)
@@ -140,7 +295,16 @@ def get_single_person(person_id):
 
     # //////////////////////////////////////////////////// Create Products end points  /////////////////////////////////
 
-@app.route('/product', methods=['POST', 'GET'])
+def product_price(value):
+    price, message = check_value(Product.__table__.c.productPrice, 'productPrice', value)
+    if message is not None:
+        raise APIException(message, status_code=400)
+    return price
+
+
+@api.route('/product', methods=['POST', 'GET'])
+@conditional(lambda: collection_state(Product, Picture))
+@CACHE.cached('product:list')
 def handle_product():
     """
     Create product and retrieve all products
@@ -156,22 +320,69 @@ def handle_product():
             raise APIException('You need to specify the product name', status_code=400)
         if 'productPrice' not in body:
             raise APIException('You need to specify the product price', status_code=400)
+        price = product_price(body['productPrice'])
 
-        product1 = Product(productName=body['productName'], productDescription=body['productDescription'], productPrice=body['productPrice'], productCategory=body['productCategory'], productAgeRange=body['productAgeRange'])
+        product1 = Product(productName=body['productName'], productDescription=body['productDescription'], productPrice=price, productCategory=body['productCategory'], productAgeRange=body['productAgeRange'])
         db.session.add(product1)
         db.session.commit()
         return "ok", 200
 
     # GET request
     if request.method == 'GET':
-        all_products = Product.query.all()
-        all_products = list(map(lambda x: x.serialize(), all_products))
-        return jsonify(all_products), 200
+        return collection_response(Product,
+                                   filters=[Product.productName, Product.productCategory, Product.productAgeRange],
+                                   sorts=[Product.productName, Product.productPrice],
+                                   ranges=[Product.productPrice])
 
     return "Invalid Method", 404
 
 
-@app.route('/product/<int:product_id>', methods=['PUT', 'GET', 'DELETE'])
+@api.route('/product/bulk', methods=['POST'])
+def bulk_product():
+    """
+    Create many products from a json array or ndjson
+    """
+    return bulk_create(Product, {
+        'productName': 'You need to specify the product name',
+        'productPrice': 'You need to specify the product price'
+    })
+
+
+@api.route('/product/stats', methods=['GET'])
+@conditional(lambda: collection_state(Product))
+@CACHE.cached('product:stats')
+def product_stats():
+    """
+    Price statistics and histogram per product category, ?bucket= sets the histogram bucket size
+    """
+    bucket = parse_decimal(request.args.get('bucket', 10))
+    if bucket is None or bucket < MIN_BUCKET:
+        raise APIException('bucket must be a number of at least %s' % MIN_BUCKET, status_code=400)
+    return jsonify(price_stats(bucket)), 200
+
+
+@api.route('/product/search', methods=['GET'])
+def search_product():
+    """
+    Ranked search on product name, category and description, the last word matches as a prefix
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        raise APIException('You need to specify the search text with ?q=', status_code=400)
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        raise APIException('limit must be an integer', status_code=400)
+    if not 0 < limit <= MAX_SEARCH_RESULTS:
+        raise APIException('limit must be between 1 and %d' % MAX_SEARCH_RESULTS, status_code=400)
+
+    SEARCH_INDEX.ensure_fresh()
+    return jsonify({"results": SEARCH_INDEX.search(query, limit)}), 200
+
+
+@api.route('/product/<int:product_id>', methods=['PUT', 'PATCH', 'GET', 'DELETE'])
+@conditional(lambda product_id: resource_state(Product, product_id, [Picture.photos_id]))
+@CACHE.cached('product:%(product_id)s')
 def get_single_product(product_id):
     """
     Single product
@@ -190,11 +401,17 @@ def get_single_product(product_id):
         if "productName" in body:
             product1.productName = body["productName"]
         if "productPrice" in body:
-            product1.productPrice = body["productPrice"]
+            product1.productPrice = product_price(body["productPrice"])
         db.session.commit()
 
         return jsonify(product1.serialize()), 200
 
+    # PATCH request, only the fields sent are changed
+    if request.method == 'PATCH':
+        return patch_response(Product, product_id, [
+            Product.productName, Product.productDescription, Product.productPrice, Product.productCategory,
+            Product.productAgeRange])
+
     # GET request
     if request.method == 'GET':
         product1 = Product.query.get(product_id)
@@ -214,7 +431,8 @@ def get_single_product(product_id):
     return "Invalid Method", 404
 
 # ////////////////////////////////// User Address end points ///////////////////////////////////
-@app.route('/address', methods=['POST', 'GET'])
+@api.route('/address', methods=['POST', 'GET'])
+@conditional(lambda: collection_state(Address))
 def handle_address():
     """
     Create address and retrieve all address
@@ -244,14 +462,43 @@ def handle_address():
 
     # GET request
     if request.method == 'GET':
-        all_address = Address.query.all()
-        all_address = list(map(lambda x: x.serialize(), all_address))
-        return jsonify(all_address), 200
+        return collection_response(Address,
+                                   filters=[Address.person_id, Address.userCity, Address.userState, Address.userZipCode],
+                                   sorts=[Address.userCity, Address.userState, Address.userZipCode])
 
     return "Invalid Method", 404
 
 
-@app.route('/address/<int:address_id>', methods=['PUT', 'GET', 'DELETE'])
+@api.route('/address/bulk', methods=['POST'])
+def bulk_address():
+    """
+    Create many addresses from a json array or ndjson
+    """
+    return bulk_create(Address, {
+        'userStreet': 'You need to specify the street',
+        'userNumber': 'You need to specify the address number',
+        'userCity': 'You need to specify the city',
+        'userState': 'You need to specify the state',
+        'userZipCode': 'You need to specify the Zip Code'
+    })
+
+
+def update_address(address1, body):
+    for field in ("userStreet", "userNumber", "userCity", "userState", "userZipCode"):
+        if field in body:
+            setattr(address1, field, body[field])
+
+
+@WRITES.writer('address_update')
+def write_address_update(body):
+    address1 = Address.query.get(body['id'])
+    if address1 is None:
+        raise LookupError('address %s not found' % body['id'])
+    update_address(address1, body)
+
+
+@api.route('/address/<int:address_id>', methods=['PUT', 'PATCH', 'GET', 'DELETE'])
+@conditional(lambda address_id: resource_state(Address, address_id))
 def get_single_address(address_id):
     """
     Single address
@@ -263,24 +510,23 @@ def get_single_address(address_id):
         if body is None:
             raise APIException("You need to specify the request body as a json object", status_code=400)
 
+        if WRITES.requested():
+            return accepted(WRITES.submit('address_update', dict(body, id=address_id)))
+
         address1 = Address.query.get(address_id)
         if address1 is None:
             raise APIException('address not found', status_code=404)
-
-        if "userStreet" in body:
-            address1.userStreet = body["userStreet"]
-        if "userNumber" in body:
-            address1.userNumber = body["userNumber"]
-        if "userCity" in body:
-            address1.userCity = body["userCity"]
-        if "userState" in body:
-            address1.userState = body["userState"]
-        if "userZipCode" in body:
-            address1.userZipCode = body["userZipCode"]
+        update_address(address1, body)
         db.session.commit()
 
         return jsonify(address1.serialize()), 200
 
+    # PATCH request, only the fields sent are changed
+    if request.method == 'PATCH':
+        return patch_response(Address, address_id, [
+            Address.userStreet, Address.userNumber, Address.userCity, Address.userState, Address.userZipCode,
+            Address.isBillingAddress])
+
     # GET request
     if request.method == 'GET':
         address1 = Address.query.get(address_id)
@@ -300,7 +546,8 @@ def get_single_address(address_id):
     return "Invalid Method", 404
 
 # //////////////////////////////////////////////Billing Address end points creation //////////////////////////////
-@app.route('/billingaddress', methods=['POST', 'GET'])
+@api.route('/billingaddress', methods=['POST', 'GET'])
+@conditional(lambda: collection_state(BillingAddress))
 def handle_billingaddress():
     """
     Create billing address and retrieve all address
@@ -330,14 +577,27 @@ def handle_billingaddress():
 
     # GET request
     if request.method == 'GET':
-        all_billingaddress = BillingAddress.query.all()
-        all_billingaddress = list(map(lambda x: x.serialize(), all_billingaddress))
-        return jsonify(all_billingaddress), 200
+        return collection_response(BillingAddress, filters=[BillingAddress.person_id])
 
     return "Invalid Method", 404
 
 
-@app.route('/billingaddress/<int:billingaddress_id>', methods=['PUT', 'GET', 'DELETE'])
+@api.route('/billingaddress/bulk', methods=['POST'])
+def bulk_billingaddress():
+    """
+    Create many billing addresses from a json array or ndjson
+    """
+    return bulk_create(BillingAddress, {
+        'billingStreet': 'You need to specify the billing street',
+        'billingNumber': 'You need to specify the billing address number',
+        'billingCity': 'You need to specify the billing city',
+        'billingState': 'You need to specify the billing state',
+        'billingZipCode': 'You need to specify the billing Zip Code'
+    })
+
+
+@api.route('/billingaddress/<int:billingaddress_id>', methods=['PUT', 'PATCH', 'GET', 'DELETE'])
+@conditional(lambda billingaddress_id: resource_state(BillingAddress, billingaddress_id))
 def get_single_billingaddress(billingaddress_id):
     """
     Single billing address
@@ -367,6 +627,12 @@ def get_single_billingaddress(billingaddress_id):
 
         return jsonify(address1.serialize()), 200
 
+    # PATCH request, only the fields sent are changed
+    if request.method == 'PATCH':
+        return patch_response(BillingAddress, billingaddress_id, [
+            BillingAddress.billingStreet, BillingAddress.billingNumber, BillingAddress.billingCity,
+            BillingAddress.billingState, BillingAddress.billingZipCode])
+
     # GET request
     if request.method == 'GET':
         address1 = BillingAddress.query.get(billingaddress_id)
@@ -386,10 +652,16 @@ def get_single_billingaddress(billingaddress_id):
     return "Invalid Method", 404
 
 # //////////////////////////////////////////// Picture End Point ////////////////////////////////
-@app.route('/picture', methods=['POST', 'GET'])
+@WRITES.writer('picture_create')
+def write_picture(body):
+    db.session.add(Picture(picture_url=body['picture_url'], photos_id=body['photos_id']))
+
+
+@api.route('/picture', methods=['POST', 'GET', 'DELETE'])
+@conditional(lambda: collection_state(Picture))
 def handle_picture():
     """
-    Create picture URL and retrieve all pictures
+    Create picture URL, retrieve all pictures and delete pictures by ?ids= or ?photos_id=
     """
 
     # POST request
@@ -400,22 +672,39 @@ def handle_picture():
             raise APIException("You need to specify the request body as a json object", status_code=400)
         if 'picture_url' not in body:
             raise APIException('You need to specify the picture URL', status_code=400)
+        if 'photos_id' not in body:
+            raise APIException('You need to specify the product id', status_code=400)
 
-        address1 = Picture(picture_url=body['picture_url'], photos_id=body['photos_id'])
-        db.session.add(address1)
+        if WRITES.requested():
+            return accepted(WRITES.submit('picture_create', body))
+
+        write_picture(body)
         db.session.commit()
         return "ok", 200
 
     # GET request
     if request.method == 'GET':
-        all_pictures = Picture.query.all()
-        all_pictures = list(map(lambda x: x.serialize(), all_pictures))
-        return jsonify(all_pictures), 200
+        return collection_response(Picture, filters=[Picture.photos_id])
+
+    # DELETE request, ?photos_id= deletes all the pictures of a product
+    if request.method == 'DELETE':
+        return bulk_delete(Picture, filters=[Picture.photos_id])
 
     return "Invalid Method", 404
 
 
-@app.route('/picture/<int:picture_id>', methods=['PUT', 'GET', 'DELETE'])
+@api.route('/picture/bulk', methods=['POST'])
+def bulk_picture():
+    """
+    Create many pictures from a json array or ndjson
+    """
+    return bulk_create(Picture, {
+        'picture_url': 'You need to specify the picture URL'
+    })
+
+
+@api.route('/picture/<int:picture_id>', methods=['PUT', 'GET', 'DELETE'])
+@conditional(lambda picture_id: resource_state(Picture, picture_id))
 def get_single_picture(picture_id):
     """
     Single picture
@@ -431,7 +720,7 @@ def get_single_picture(picture_id):
         if address1 is None:
             raise APIException('picture not found', status_code=404)
         if "PictureURL" in body:
-            address1.picture_url = body["picture_url"]
+            address1.picture_url = body["PictureURL"]
 
         db.session.commit()
 
@@ -458,4 +747,4 @@ def get_single_picture(picture_id):
 # /////////////////////////////////////// Start Server //////////////////////////////
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
-    app.run(host='0.0.0.0', port=PORT)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=PORT)
\ No newline at end of file
@@ -1,18 +1,50 @@
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from replicas import RoutingSession
+
+# GET requests read from the replicas when DB_REPLICA_URLS is set, see replicas.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def enable_sqlite_foreign_keys(app):
+    """
+    sqlite ignores foreign keys, and their ON DELETE CASCADE, unless every connection turns them on.
+    Only on the engines of the app: alembic connects with an engine of its own, and its batch
+    migrations rebuild tables other tables reference, which fails with foreign keys on.
+    """
+    def foreign_keys_on(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA foreign_keys=ON')
+            cursor.close()
+
+    with app.app_context():
+        # the replica engines too
+        for engine in db.engines.values():
+            event.listen(engine, 'connect', foreign_keys_on)
 
-db = SQLAlchemy()
 
 class User(db.Model):
     __tablename__ = 'users'
+    # /login looks users up by both columns
+    __table_args__ = (db.Index('ix_users_userName_email', 'userName', 'email'),)
 
     id = db.Column(db.Integer, primary_key=True)
     userFirstName = db.Column(db.String(45), nullable=False)
-    userLastName = db.Column(db.String(45), nullable=False)
+    userLastName = db.Column(db.String(45), nullable=False, index=True)
     userName = db.Column(db.String(45), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(45), nullable=False)
-    addresses = db.relationship('Address', backref='person', lazy=True)
-    bill_address = db.relationship('BillingAddress', backref='person', lazy=True)
+    # a pbkdf2_sha256 hash, see passwords.py
+    password = db.Column(db.String(255), nullable=False)
+    # the database deletes the addresses with the user (ON DELETE CASCADE), the ORM doesn't load them for that
+    addresses = db.relationship('Address', backref='person', lazy=True,
+                                cascade='all, delete-orphan', passive_deletes=True)
+    bill_address = db.relationship('BillingAddress', backref='person', lazy=True,
+                                   cascade='all, delete-orphan', passive_deletes=True)
+    # bumped on every update, used for optimistic locking and to build ETags
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self):
         return '<Person %r>' % self.userName
@@ -35,7 +67,6 @@ class User(db.Model):
             "userLastName": self.userLastName,
             "userName": self.userName,
             "email": self.email,
-            "password": self.password,
             "addresses": addresses,  #call the empty array that was looped before the return
             "billAddress": billAddress
         }
@@ -46,10 +77,13 @@ class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     productName = db.Column(db.String(45), unique=True, nullable=False)
     productDescription = db.Column(db.String(255), unique=True, nullable=True)
-    productPrice = db.Column(db.String(45), unique=False, nullable=False)
-    productCategory = db.Column(db.String(45), unique=False, nullable=True)
-    productAgeRange = db.Column(db.String(45), unique=False, nullable=True)
-    pictureUrl = db.relationship('Picture', backref='photos', lazy=True)
+    productPrice = db.Column(db.Numeric(10, 2), unique=False, nullable=False, index=True)
+    productCategory = db.Column(db.String(45), unique=False, nullable=True, index=True)
+    productAgeRange = db.Column(db.String(45), unique=False, nullable=True, index=True)
+    pictureUrl = db.relationship('Picture', backref='photos', lazy=True,
+                                 cascade='all, delete-orphan', passive_deletes=True)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
     # bill_address = db.relationship('BillingAddress', backref='person', lazy=True)
 
     def __repr__(self):
@@ -63,7 +97,7 @@ class Product(db.Model):
             "ProductId": self.id,
             "ProductName": self.productName,
             "productDescription": self.productDescription,
-            "productPrice": self.productPrice,
+            "productPrice": str(self.productPrice),
             "productCategory": self.productCategory,
             "productAgeRange": self.productAgeRange,
             "photo": photo
@@ -75,12 +109,15 @@ class Address(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     userStreet = db.Column(db.String(45), nullable=False)
     userNumber = db.Column(db.String(45), nullable=False)
-    userCity = db.Column(db.String(45), nullable=False)
-    userState = db.Column(db.String(45), nullable=False)
-    userZipCode = db.Column(db.String(12), nullable=False)
+    userCity = db.Column(db.String(45), nullable=False, index=True)
+    userState = db.Column(db.String(45), nullable=False, index=True)
+    userZipCode = db.Column(db.String(12), nullable=False, index=True)
     isBillingAddress=db.Column(db.Boolean)
-    person_id = db.Column(db.Integer, db.ForeignKey('users.id'),
-        nullable=False)
+    person_id = db.Column(db.Integer,
+        db.ForeignKey('users.id', name='fk_addresses_person_id_users', ondelete='CASCADE'),
+        nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
 
 
     def __repr__(self):
@@ -107,8 +144,11 @@ class BillingAddress(db.Model):
     billingCity = db.Column(db.String(45), nullable=True)
     billingState = db.Column(db.String(45), nullable=True)
     billingZipCode = db.Column(db.String(12), nullable=True)
-    person_id = db.Column(db.Integer, db.ForeignKey('users.id'),
-        nullable=False)
+    person_id = db.Column(db.Integer,
+        db.ForeignKey('users.id', name='fk_billing_addresses_person_id_users', ondelete='CASCADE'),
+        nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self):
         return '<BillingAddress %r>' % self.billingStreet
@@ -129,7 +169,11 @@ class Picture(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     picture_url = db.Column(db.Text, nullable=False)
-    photos_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    photos_id = db.Column(db.Integer,
+        db.ForeignKey('products.id', name='fk_pictures_photos_id_products', ondelete='CASCADE'),
+        nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
     # person_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     def __repr__(self):
         return '<Picture %r>' % self.picture_url
@@ -139,3 +183,27 @@ class Picture(db.Model):
             "PictureURL": self.picture_url,
             "productId": self.photos_id
         }
+
+class TableChange(db.Model):
+    """
+    Change counters of the other tables, bumped in the transaction of every write to them and
+    only ever going up, see etag.py. deletes only counts the deletes, an id can be reused after one.
+    """
+    __tablename__ = 'table_changes'
+
+    table_name = db.Column(db.String(45), primary_key=True)
+    changes = db.Column(db.BigInteger, nullable=False, server_default='0')
+    deletes = db.Column(db.BigInteger, nullable=False, server_default='0')
+
+    def __repr__(self):
+        return '<TableChange %r>' % self.table_name
+
+
+def counted_tables():
+    return [table for table in db.metadata.sorted_tables if table is not TableChange.__table__]
+
+
+@event.listens_for(TableChange.__table__, 'after_create')
+def add_table_counters(target, connection, **kw):
+    # db.create_all() has no migration to add the rows
+    connection.execute(target.insert(), [{'table_name': table.name} for table in counted_tables()])
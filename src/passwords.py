@@ -0,0 +1,68 @@
+"""
+Password hashing with PBKDF2-SHA256 from the standard library.
+The cost is set with PASSWORD_HASH_ITERATIONS and stored in every hash, so a login with a hash made
+under other settings (or a password still stored in plain text) is verified with its own parameters
+and rehashed with the current ones.
+Hashing runs on a pool of PASSWORD_HASH_THREADS threads, a burst of logins then uses at most that
+many cores and the other requests keep being served.
+"""
+import os
+import hmac
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+ALGORITHM = 'pbkdf2_sha256'
+ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 260000))
+SALT_BYTES = 16
+
+HASH_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get('PASSWORD_HASH_THREADS', os.cpu_count() or 2)),
+                                   thread_name_prefix='password-hash')
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf8'), salt.encode('ascii'), iterations)
+
+
+def _make_hash(password, iterations):
+    salt = _b64(os.urandom(SALT_BYTES))
+    return '%s$%d$%s$%s' % (ALGORITHM, iterations, salt, _b64(_pbkdf2(password, salt, iterations)))
+
+
+def _check(password, stored):
+    parts = stored.split('$')
+    if len(parts) != 4 or parts[0] != ALGORITHM:
+        # rows created before passwords were hashed
+        return hmac.compare_digest(password.encode('utf8'), stored.encode('utf8')), True
+    iterations, salt, expected = int(parts[1]), parts[2], parts[3]
+    ok = hmac.compare_digest(_b64(_pbkdf2(password, salt, iterations)), expected)
+    return ok, iterations != ITERATIONS
+
+
+def hash_password(password):
+    return HASH_EXECUTOR.submit(_make_hash, password, ITERATIONS).result()
+
+
+def verify_password(password, stored):
+    """
+    Returns (matches, needs_rehash), needs_rehash tells the stored value doesn't use the current cost
+    or isn't hashed at all
+    """
+    return HASH_EXECUTOR.submit(_check, password, stored).result()
+
+
+_dummy = []
+
+
+def dummy_hash():
+    """
+    Hash compared against when the user doesn't exist, so a login for an unknown user takes as long
+    as a wrong password. Made on first use, it would cost a full hash at import time.
+    """
+    if not _dummy:
+        _dummy.append(_make_hash('', ITERATIONS))
+    return _dummy[0]
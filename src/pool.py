@@ -0,0 +1,118 @@
+"""
+Connection pool configuration from environment variables and pool usage counters
+"""
+import os
+import time
+import threading
+import weakref
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+# the apps whose pools a forked child drops, create_app() runs once per test
+_FORK_APPS = weakref.WeakKeyDictionary()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that counts checkouts and how long requests waited for a connection
+    when the pool and its overflow were exhausted
+    """
+
+    def __init__(self, *args, **kwargs):
+        QueuePool.__init__(self, *args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        # no idle connection and no room to open a new one: this checkout will block
+        exhausted = self.checkedin() == 0 and 0 <= self._max_overflow <= self.overflow()
+        start = time.perf_counter()
+        try:
+            conn = QueuePool._do_get(self)
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self.checkouts += 1
+            if exhausted:
+                self.waits += 1
+                self.wait_time += waited
+                self.max_wait_time = max(self.max_wait_time, waited)
+        return conn
+
+    def recreate(self):
+        # keep the counters when the pool is recreated after a disconnect
+        pool = QueuePool.recreate(self)
+        pool.__dict__.update({k: getattr(self, k) for k in
+                              ('checkouts', 'waits', 'timeouts', 'wait_time', 'max_wait_time')})
+        return pool
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "size": self.size(),
+            "maxOverflow": self._max_overflow,
+            "checkedIn": self.checkedin(),
+            "checkedOut": self.checkedout(),
+            "overflow": self.overflow(),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "waitTimeTotalMs": round(self.wait_time * 1000, 3),
+            "waitTimeMaxMs": round(self.max_wait_time * 1000, 3)
+        }
+
+
+def engine_options_from_env(database_uri):
+    """
+    Engine options for SQLALCHEMY_ENGINE_OPTIONS, read from
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE and DB_POOL_PRE_PING
+    """
+    # in memory sqlite needs its single shared connection, leave the default pool
+    if not database_uri or (database_uri.startswith('sqlite') and
+                            (database_uri in ('sqlite://', 'sqlite:///') or ':memory:' in database_uri)):
+        return {}
+
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_pre_ping": os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    }
+    for env, option in (('DB_POOL_SIZE', 'pool_size'), ('DB_MAX_OVERFLOW', 'max_overflow'),
+                        ('DB_POOL_TIMEOUT', 'pool_timeout'), ('DB_POOL_RECYCLE', 'pool_recycle')):
+        if os.environ.get(env):
+            options[option] = int(os.environ[env])
+    return options
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    if isinstance(pool, InstrumentedQueuePool):
+        return pool.stats()
+    return {"pid": os.getpid(), "pool": type(pool).__name__, "status": pool.status()}
+
+
+def dispose_after_fork(app, db):
+    """
+    A forked worker (gunicorn --preload) gets a copy of the pool of its parent, two processes using
+    the same connection corrupt it. The child drops the copies without closing them, the parent
+    keeps its connections and the child opens new ones on first use.
+    """
+    _FORK_APPS[app] = db
+
+
+def _reset_pools():
+    for app, db in list(_FORK_APPS.items()):
+        with app.app_context():
+            # the replica engines too
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+
+# registered once for the process, it walks the apps still alive
+os.register_at_fork(after_in_child=_reset_pools)
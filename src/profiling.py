@@ -0,0 +1,188 @@
+"""
+Opt-in request instrumentation, enabled with PROFILING=1.
+Records per-route latency histograms, SQL statement count and time, serialization and compression time,
+reports them in a Server-Timing header and on GET /metrics.
+With PROFILE_SLOW_MS set, a sampling profiler dumps the stacks of requests slower than that
+many milliseconds to PROFILE_DIR, in the collapsed format flamegraph tools read.
+"""
+import os
+import re
+import sys
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, request, has_request_context, jsonify
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from threads import ensure_thread
+
+# upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+
+
+class RouteMetrics(object):
+
+    def __init__(self):
+        self.count = 0
+        self.histogram = [0] * len(BUCKETS)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.sql_statements = 0
+        self.sql_ms = 0.0
+        self.serialize_ms = 0.0
+        self.compress_ms = 0.0
+
+    def add(self, total_ms, timings):
+        self.count += 1
+        self.total_ms += total_ms
+        self.max_ms = max(self.max_ms, total_ms)
+        self.histogram[next(i for i, bound in enumerate(BUCKETS) if total_ms <= bound)] += 1
+        self.sql_statements += timings['sql_count']
+        self.sql_ms += timings['sql']
+        self.serialize_ms += timings['serialize']
+        self.compress_ms += timings['compress']
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "avgMs": round(self.total_ms / self.count, 3) if self.count else 0,
+            "maxMs": round(self.max_ms, 3),
+            "histogram": dict(("le_%s" % bound, n) for bound, n in zip(BUCKETS, self.histogram)),
+            "sqlStatements": self.sql_statements,
+            "sqlMs": round(self.sql_ms, 3),
+            "serializeMs": round(self.serialize_ms, 3),
+            "compressMs": round(self.compress_ms, 3)
+        }
+
+
+METRICS = {}
+METRICS_LOCK = threading.Lock()
+
+
+def current_timings():
+    if not has_request_context():
+        return None
+    return g.get('timings')
+
+
+@contextmanager
+def phase(name):
+    """
+    Adds the time spent in the block to the current request, e.g. with phase('serialize'):
+    """
+    timings = current_timings()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['query_start'].pop()
+    timings = current_timings()
+    if timings is not None:
+        timings['sql_count'] += 1
+        timings['sql'] += (time.perf_counter() - start) * 1000
+
+
+class StackSampler(object):
+    """
+    Background thread that samples the stacks of the threads serving a request
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            self.thread = ensure_thread(self.thread, self.run, 'stack-sampler')
+            self.samples[threading.get_ident()] = Counter()
+
+    def stop(self):
+        with self.lock:
+            return self.samples.pop(threading.get_ident(), Counter())
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, counter in self.samples.items():
+                    frame = frames.get(ident)
+                    stack = []
+                    while frame is not None:
+                        stack.append('%s (%s:%d)' % (frame.f_code.co_name,
+                                                     os.path.basename(frame.f_code.co_filename), frame.f_lineno))
+                        frame = frame.f_back
+                    if stack:
+                        counter[';'.join(reversed(stack))] += 1
+
+
+def dump_profile(directory, route, duration_ms, samples):
+    name = '%d-%s-%dms.txt' % (time.time() * 1000, re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_'), duration_ms)
+    with open(os.path.join(directory, name), 'w') as f:
+        for stack, count in samples.most_common():
+            f.write('%s %d\n' % (stack, count))
+
+
+def init_profiling(app):
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    slow_ms = float(os.environ['PROFILE_SLOW_MS']) if os.environ.get('PROFILE_SLOW_MS') else None
+    profile_dir = os.environ.get('PROFILE_DIR', 'profiles')
+    sampler = None
+    if slow_ms is not None:
+        if not os.path.isdir(profile_dir):
+            os.makedirs(profile_dir)
+        sampler = StackSampler()
+
+    @app.before_request
+    def start_timer():
+        g.timings = {'start': time.perf_counter(), 'sql_count': 0, 'sql': 0.0, 'serialize': 0.0, 'compress': 0.0}
+        if sampler is not None:
+            sampler.start()
+
+    @app.after_request
+    def record_timings(response):
+        timings = g.get('timings')
+        if timings is None:
+            return response
+        total_ms = (time.perf_counter() - timings['start']) * 1000
+        route = '%s %s' % (request.method, request.url_rule.rule if request.url_rule else '<unmatched>')
+        with METRICS_LOCK:
+            METRICS.setdefault(route, RouteMetrics()).add(total_ms, timings)
+
+        # streamed bodies are produced and compressed after this point, their time is not included
+        response.headers['Server-Timing'] = (
+            'sql;desc="%d queries";dur=%.2f, serialize;dur=%.2f, compress;dur=%.2f, total;dur=%.2f' % (
+                timings['sql_count'], timings['sql'], timings['serialize'], timings['compress'], total_ms))
+
+        if sampler is not None:
+            samples = sampler.stop()
+            if total_ms >= slow_ms and samples:
+                dump_profile(profile_dir, route, total_ms, samples)
+        return response
+
+    @app.teardown_request
+    def stop_sampling(exc):
+        # after_request is skipped when the view raised
+        if sampler is not None:
+            sampler.stop()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        with METRICS_LOCK:
+            return jsonify(dict((route, m.to_dict()) for route, m in METRICS.items())), 200
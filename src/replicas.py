@@ -0,0 +1,127 @@
+"""
+Read replica routing.
+DB_REPLICA_URLS lists connection strings of replicas of DB_CONNECTION_STRING, separated by commas.
+GET and HEAD requests read from one replica picked per request, lazy relationship loads included,
+everything else (writes, flushes, requests without a request context like the write-behind worker)
+uses the primary. A request that wrote sets a cookie that sends the reads of that client to the
+primary for DB_REPLICA_STALENESS seconds, long enough for the replicas to catch up with its writes.
+"""
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from flask import request, g, has_request_context
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy.sql.dml import UpdateBase
+from pool import engine_options_from_env
+from threads import ensure_thread
+
+logger = logging.getLogger(__name__)
+
+REPLICA_URLS = [url.strip() for url in os.environ.get('DB_REPLICA_URLS', '').split(',') if url.strip()]
+STALENESS = float(os.environ.get('DB_REPLICA_STALENESS', 5))
+PRIMARY_COOKIE = 'read_primary_until'
+READ_METHODS = ('GET', 'HEAD')
+
+
+def replica_binds(urls=None):
+    """
+    SQLALCHEMY_BINDS entries for the replicas, with the pool settings of the primary
+    """
+    urls = REPLICA_URLS if urls is None else urls
+    return dict(('replica%d' % i, dict(engine_options_from_env(url), url=url)) for i, url in enumerate(urls))
+
+
+def replica_engines(db):
+    return [engine for key, engine in sorted(db.engines.items(), key=lambda item: str(item[0]))
+            if key is not None and key.startswith('replica')]
+
+
+def reads_from_replica():
+    if not REPLICA_URLS or not has_request_context() or request.method not in READ_METHODS:
+        return False
+    until = request.cookies.get(PRIMARY_COOKIE)
+    try:
+        return until is None or float(until) < time.time()
+    except ValueError:
+        return True
+
+
+class RoutingSession(FlaskSession):
+    """
+    Session sending the reads of GET requests to a replica
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) and reads_from_replica():
+            if 'replica' not in g:
+                # one replica per request, its reads see a single state of the data
+                engines = replica_engines(self._db)
+                g.replica = random.choice(engines) if engines else None
+            if g.replica is not None:
+                return g.replica
+        return FlaskSession.get_bind(self, mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_replicas(app):
+    """
+    Marks the clients that wrote so their next reads go to the primary
+    """
+    max_age = max(1, int(round(STALENESS)))
+
+    @app.after_request
+    def read_your_writes(response):
+        if request.method not in READ_METHODS and request.method != 'OPTIONS' and response.status_code < 400:
+            response.set_cookie(PRIMARY_COOKIE, '%.3f' % (time.time() + STALENESS), max_age=max_age, httponly=True)
+        return response
+
+
+class Replayer(object):
+    """
+    Calls a callback a second time once the replicas had STALENESS seconds to apply a commit.
+    A cache invalidated on commit can be filled again from a replica that hasn't seen the commit yet,
+    the second call drops that value. One thread serves every callback, delays are all the same
+    so the callbacks come due in the order they were added.
+    """
+
+    def __init__(self, delay=STALENESS):
+        self.delay = delay
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def add(self, callback):
+        with self.condition:
+            self.pending.append((time.time() + self.delay, callback))
+            self.thread = ensure_thread(self.thread, self.run, 'replica-replay')
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                due, callback = self.pending[0]
+                wait = due - time.time()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                self.pending.popleft()
+            try:
+                callback()
+            except Exception:
+                logger.exception('replayed callback failed')
+
+
+REPLAYER = Replayer()
+
+
+def after_replication(callback):
+    """
+    Calls callback now and, when there are replicas, again once they caught up
+    """
+    callback()
+    if REPLICA_URLS:
+        REPLAYER.add(callback)
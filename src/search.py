@@ -0,0 +1,210 @@
+"""
+In process inverted index over the product name, category and description used by /product/search.
+The index follows the products table through SQLAlchemy events for the writes made by this
+process and re-syncs from the row versions when another worker changed the table, which its
+change counters tell. The counter bumps of this process's own writes are counted in as they are
+applied, so they don't cause a re-sync.
+"""
+import os
+import re
+import math
+import time
+import heapq
+import bisect
+import threading
+from collections import Counter
+from sqlalchemy import select
+from models import db, Product
+from etag import table_counters
+from changes import track_writes
+
+# a token found in the name counts more than one found in the category or the description
+FIELD_WEIGHTS = (('productName', 3.0), ('productCategory', 2.0), ('productDescription', 1.0))
+# largest ?limit= of /product/search
+MAX_SEARCH_RESULTS = 100
+# the last search term matches as a prefix, this caps how many tokens it can expand to
+MAX_PREFIX_TOKENS = 50
+# a token that only starts with the search term scores less than an exact match
+PREFIX_WEIGHT = 0.5
+# how often a worker checks if the products table changed behind its back
+SYNC_INTERVAL = float(os.environ.get('SEARCH_SYNC_SECONDS', 5))
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+class ProductIndex(object):
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.postings = {}      # token -> {product id: weight}
+        self.docs = {}          # product id -> (version, name, category, tokens)
+        self.vocabulary = []    # sorted tokens, for prefix lookups
+        self.table_state = None
+        self.checked_at = 0
+        self.stale = True
+
+    def add(self, ident, version, name, description, category):
+        with self.lock:
+            self.remove(ident)
+            values = {'productName': name, 'productCategory': category, 'productDescription': description}
+            weights = Counter()
+            for field, weight in FIELD_WEIGHTS:
+                for token in tokenize(values[field]):
+                    weights[token] += weight
+            for token, weight in weights.items():
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = {}
+                    bisect.insort(self.vocabulary, token)
+                posting[ident] = weight
+            self.docs[ident] = (version, name, category, tuple(weights))
+
+    def remove(self, ident):
+        with self.lock:
+            doc = self.docs.pop(ident, None)
+            if doc is None:
+                return
+            for token in doc[3]:
+                posting = self.postings[token]
+                del posting[ident]
+                if not posting:
+                    del self.postings[token]
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    def prefix_tokens(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        tokens = []
+        for token in self.vocabulary[start:start + MAX_PREFIX_TOKENS]:
+            if not token.startswith(prefix):
+                break
+            tokens.append(token)
+        return tokens
+
+    def search(self, query, limit=10):
+        """
+        Ranked search, every term has to match and the last one matches as a prefix
+        so partial input can be used for autocomplete
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self.lock:
+            total = float(len(self.docs))
+            groups = []
+            for i, term in enumerate(terms):
+                tokens = self.prefix_tokens(term) if i == len(terms) - 1 else [term]
+                group = []
+                for token in tokens:
+                    posting = self.postings.get(token)
+                    if posting:
+                        # rare tokens say more about a product than common ones
+                        idf = math.log(1.0 + total / len(posting))
+                        group.append((posting, idf if token == term else idf * PREFIX_WEIGHT))
+                if not group:
+                    return []
+                groups.append(group)
+
+            if len(groups) == 1:
+                # a product scores the best of the tokens the term expanded to, so the best
+                # products overall are among the best products of each token
+                scores = {}
+                for posting, idf in groups[0]:
+                    for ident in heapq.nlargest(limit, posting, key=posting.__getitem__):
+                        if posting[ident] * idf > scores.get(ident, 0):
+                            scores[ident] = posting[ident] * idf
+                top = [(ident, scores[ident]) for ident in heapq.nlargest(limit, scores, key=scores.__getitem__)]
+            else:
+                # intersect the products matching every term first, set operations run in C,
+                # then score only the products left
+                groups.sort(key=lambda group: sum(len(posting) for posting, _ in group))
+                matching = None
+                for group in groups:
+                    keys = group[0][0].keys() if len(group) == 1 else set().union(*[posting for posting, _ in group])
+                    matching = set(keys) if matching is None else matching.intersection(keys)
+                    if not matching:
+                        return []
+                scores = dict.fromkeys(matching, 0.0)
+                for group in groups:
+                    if len(group) == 1:
+                        posting, idf = group[0]
+                        for ident in matching:
+                            scores[ident] += posting[ident] * idf
+                        continue
+                    for ident in matching:
+                        best = 0.0
+                        for posting, idf in group:
+                            weight = posting.get(ident)
+                            if weight is not None and weight * idf > best:
+                                best = weight * idf
+                        scores[ident] += best
+                top = [(ident, scores[ident]) for ident in heapq.nlargest(limit, scores, key=scores.__getitem__)]
+
+            return [{
+                "ProductId": ident,
+                "ProductName": self.docs[ident][1],
+                "productCategory": self.docs[ident][2],
+                "score": round(score, 4)
+            } for ident, score in top]
+
+    def ensure_fresh(self):
+        """
+        Re-syncs from the database when the products table changed outside this process,
+        checked at most every SYNC_INTERVAL seconds
+        """
+        if not self.stale and time.time() - self.checked_at < SYNC_INTERVAL:
+            return
+        state = table_counters(Product)
+        with self.lock:
+            if self.stale or state != self.table_state:
+                # after a delete a new product can get the id and the version of an indexed one
+                self.sync(full=self.table_state is None or state[1] != self.table_state[1])
+            self.table_state = state
+            self.checked_at = time.time()
+            self.stale = False
+
+    def sync(self, full=False):
+        current = dict(db.session.execute(select(Product.id, Product.version)).all())
+        for ident in [i for i in self.docs if i not in current]:
+            self.remove(ident)
+        changed = [i for i, version in current.items() if full or self.docs.get(i, (None,))[0] != version]
+        for start in range(0, len(changed), 500):
+            stmt = select(Product.id, Product.version, Product.productName, Product.productDescription,
+                          Product.productCategory).where(Product.id.in_(changed[start:start + 500]))
+            for row in db.session.execute(stmt):
+                self.add(*row)
+
+
+def register_search_index(index):
+    """
+    Applies the product writes of this process to the index once they are committed
+    """
+    def on_row(changes, target, deleted):
+        changes[target.id] = None if deleted else (
+            target.version, target.productName, target.productDescription, target.productCategory)
+
+    def on_statement(changes, table, deleted):
+        # bulk statements don't say which rows they touched, re-sync on the next search
+        changes['stale'] = True
+
+    def on_commit(session, changes):
+        if changes.pop('stale', False):
+            index.stale = True
+        with index.lock:
+            # the index is built on the first search, nothing to keep up to date before that
+            if index.table_state is None:
+                return
+            for ident, row in changes.items():
+                if row is None:
+                    index.remove(ident)
+                else:
+                    index.add(ident, *row)
+            # the transaction bumped the counters once, see etag.register_change_counters
+            updates, deletes = index.table_state
+            deleted = any(row is None for row in changes.values())
+            index.table_state = (updates + 1, deletes + (1 if deleted else 0))
+
+    track_writes('search_index', (Product,), on_row, on_statement, on_commit)
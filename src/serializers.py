@@ -0,0 +1,192 @@
+"""
+Fast serialization path for the collection endpoints.
+Each model gets a RowSerializer built once at import time that selects only the columns
+its serialize() method outputs and turns the Core result tuples straight into dicts,
+nested rows are loaded with one query per relationship.
+The output is the same as calling serialize() on every instance.
+"""
+import os
+import json
+from collections import defaultdict
+from flask import Response
+from sqlalchemy import select
+from models import db, User, Product, Address, BillingAddress, Picture
+from profiling import phase
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, separators=(',', ':'))
+
+# JSON_ENCODER=stdlib forces the standard library encoder even if orjson is installed
+try:
+    if os.environ.get('JSON_ENCODER') == 'stdlib':
+        raise ImportError
+    import orjson
+    dumps = orjson.dumps
+    JSON_ENCODER = 'orjson'
+except ImportError:
+    dumps = _stdlib_dumps
+    JSON_ENCODER = 'stdlib'
+
+
+def to_bytes(data):
+    return data if isinstance(data, bytes) else data.encode('utf-8')
+
+
+def json_response(data, status=200):
+    with phase('serialize'):
+        body = dumps(data)
+    return Response(body, status=status, mimetype='application/json')
+
+
+class RowSerializer(object):
+    """
+    fields is a list of (column, json key) pairs in the order serialize() uses, a third item
+    can give a function to convert the column value,
+    nested is a list of (json key, child serializer, foreign key column) for the child lists
+    """
+
+    def __init__(self, model, fields, nested=()):
+        self.model = model
+        self.fields = list(fields)
+        self.keys = tuple(field[1] for field in fields)
+        self.columns = [field[0] for field in fields]
+        self.converters = [(field[1], field[2]) for field in fields if len(field) > 2]
+        self.nested = list(nested)
+        self.all_keys = self.keys + tuple(key for key, _, _ in self.nested)
+        self._subsets = {}
+
+    def only(self, keys):
+        """
+        Serializer for a sparse fieldset, it selects only the columns of the requested keys
+        and loads a nested list only if its key is requested
+        """
+        keys = frozenset(keys)
+        if keys not in self._subsets:
+            self._subsets[keys] = RowSerializer(
+                self.model,
+                [field for field in self.fields if field[1] in keys],
+                [item for item in self.nested if item[0] in keys])
+        return self._subsets[keys]
+
+    def select(self, *extra):
+        # the primary key always goes last, it is needed for pagination and to attach the children
+        return select(*(self.columns + list(extra) + [self.model.id]))
+
+    def fetch(self, stmt, all_rows=False):
+        """
+        Runs a select() built from self.select() and returns the serialized rows.
+        all_rows tells the statement isn't filtered so the children don't need an IN list.
+        """
+        return self.serialize_rows(db.session.execute(stmt).all(), all_rows)
+
+    def encode(self, stmt, partition_size):
+        """
+        Runs a select() built from self.select() and returns the json array of the serialized rows as bytes.
+        The rows are fetched, serialized and encoded a partition at a time, only the encoded output
+        and one partition are held at once. Only for serializers without nested lists, their children
+        are loaded for a whole result.
+        """
+        result = db.session.execute(stmt.execution_options(yield_per=partition_size))
+        chunks = []
+        for rows in result.partitions():
+            items = self.serialize_rows(rows)
+            with phase('serialize'):
+                # the partition as a json array without its brackets
+                chunks.append(to_bytes(dumps(items))[1:-1])
+        return b"[" + b",".join(chunks) + b"]"
+
+    def serialize_rows(self, rows, all_rows=False):
+        keys = self.keys
+        # zip stops at the last key, the extra columns (sort keys, primary key) are left out
+        if not self.nested and not self.converters:
+            with phase('serialize'):
+                return [dict(zip(keys, row)) for row in rows]
+
+        ids = None if all_rows or not self.nested else [row[-1] for row in rows]
+        children = [(key, child.children_by_parent(fk, ids)) for key, child, fk in self.nested]
+        with phase('serialize'):
+            result = []
+            for row in rows:
+                item = dict(zip(keys, row))
+                for key, convert in self.converters:
+                    item[key] = convert(item[key])
+                for key, groups in children:
+                    item[key] = groups.get(row[-1], [])
+                result.append(item)
+        return result
+
+    def children_by_parent(self, fk, ids):
+        """
+        Loads the child rows pointing to the ids (or to any row when ids is None) grouped by parent id
+        """
+        if ids is not None and not ids:
+            return {}
+        stmt = self.select(fk).order_by(self.model.id)
+        if ids is not None:
+            stmt = stmt.where(fk.in_(ids))
+        groups = defaultdict(list)
+        width = len(self.keys)
+        keys = self.keys
+        for row in db.session.execute(stmt):
+            item = dict(zip(keys, row))
+            for key, convert in self.converters:
+                item[key] = convert(item[key])
+            groups[row[width]].append(item)
+        return groups
+
+
+ADDRESS = RowSerializer(Address, [
+    (Address.id, "streetId"),
+    (Address.userStreet, "UserStreet"),
+    (Address.userNumber, "UserNumber"),
+    (Address.userCity, "UserCity"),
+    (Address.userState, "UserState"),
+    (Address.userZipCode, "UserZipCode"),
+    (Address.isBillingAddress, "Same_as_Billing_Address"),
+    (Address.person_id, "user")
+])
+
+BILLING_ADDRESS = RowSerializer(BillingAddress, [
+    (BillingAddress.billingStreet, "BillingStreet"),
+    (BillingAddress.billingNumber, "BillingNumber"),
+    (BillingAddress.billingCity, "BillingCity"),
+    (BillingAddress.billingState, "BillingState"),
+    (BillingAddress.billingZipCode, "BillingZipCode"),
+    (BillingAddress.person_id, "user")
+])
+
+PICTURE = RowSerializer(Picture, [
+    (Picture.picture_url, "PictureURL"),
+    (Picture.photos_id, "productId")
+])
+
+USER = RowSerializer(User, [
+    (User.id, "userid"),
+    (User.userFirstName, "userFirstName"),
+    (User.userLastName, "userLastName"),
+    (User.userName, "userName"),
+    (User.email, "email")
+], nested=[
+    ("addresses", ADDRESS, Address.person_id),
+    ("billAddress", BILLING_ADDRESS, BillingAddress.person_id)
+])
+
+PRODUCT = RowSerializer(Product, [
+    (Product.id, "ProductId"),
+    (Product.productName, "ProductName"),
+    (Product.productDescription, "productDescription"),
+    (Product.productPrice, "productPrice", str),
+    (Product.productCategory, "productCategory"),
+    (Product.productAgeRange, "productAgeRange")
+], nested=[
+    ("photo", PICTURE, Picture.photos_id)
+])
+
+SERIALIZERS = {
+    User: USER,
+    Product: PRODUCT,
+    Address: ADDRESS,
+    BillingAddress: BILLING_ADDRESS,
+    Picture: PICTURE
+}
@@ -0,0 +1,63 @@
+"""
+Product price statistics computed with SQL aggregates
+"""
+from decimal import Decimal
+from sqlalchemy import select, func, cast, case, Integer
+from models import db, Product
+
+# smallest histogram bucket, a cent, smaller ones would overflow the bucket numbers
+MIN_BUCKET = Decimal('0.01')
+
+
+def as_number(value):
+    return round(float(value), 2) if value is not None else None
+
+
+def price_stats(bucket):
+    """
+    Count, min, max and average price per category plus a histogram with buckets of the given size,
+    one GROUP BY query whatever the size of the catalog, the per category numbers are
+    folded from the few histogram rows
+    """
+    price = Product.productPrice
+    category = Product.productCategory
+    # postgres rounds when casting to integer, sqlite may be built without floor()
+    if db.engine.dialect.name == 'sqlite':
+        quotient = price / bucket
+        truncated = cast(quotient, Integer)
+        # the cast truncates toward zero, a price below zero goes one bucket down
+        slot = truncated - case((quotient < truncated, 1), else_=0)
+    else:
+        slot = func.floor(price / bucket)
+
+    rows = db.session.execute(
+        select(category, slot, func.count(Product.id), func.min(price), func.max(price), func.sum(price))
+        .group_by(category, slot).order_by(category, slot)).all()
+
+    categories = []
+    for name, index, count, low, high, total in rows:
+        if not categories or categories[-1]["productCategory"] != name:
+            categories.append({"productCategory": name, "count": 0, "min": low, "max": high, "sum": 0,
+                               "histogram": []})
+        stats = categories[-1]
+        stats["count"] += count
+        stats["min"] = min(stats["min"], low)
+        stats["max"] = max(stats["max"], high)
+        stats["sum"] += total
+        stats["histogram"].append({
+            "from": as_number(int(index) * bucket),
+            "to": as_number((int(index) + 1) * bucket),
+            "count": count
+        })
+
+    return {
+        "bucketSize": as_number(bucket),
+        "categories": [{
+            "productCategory": stats["productCategory"],
+            "count": stats["count"],
+            "min": as_number(stats["min"]),
+            "max": as_number(stats["max"]),
+            "avg": as_number(stats["sum"] / stats["count"]),
+            "histogram": stats["histogram"]
+        } for stats in categories]
+    }
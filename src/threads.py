@@ -0,0 +1,16 @@
+"""
+Background threads of the worker processes
+"""
+import threading
+
+
+def ensure_thread(thread, target, name):
+    """
+    thread if it is running, else a new daemon thread running target. Called on first use,
+    a thread started before a fork doesn't run in the workers. The caller holds its lock.
+    """
+    if thread is None or not thread.is_alive():
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+    return thread
@@ -1,4 +1,22 @@
-from flask import jsonify, url_for
+import os
+import base64
+import hashlib
+from decimal import Decimal, InvalidOperation
+from flask import jsonify, url_for, request, json, Response, stream_with_context
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from models import db
+from serializers import SERIALIZERS, dumps, json_response, to_bytes
+from compression import matched_etag, negotiate, compress, MIN_SIZE
+
+# largest page a client can ask for with ?limit=
+MAX_PAGE_SIZE = 1000
+# rows fetched per round trip while streaming, from a server-side cursor or a keyset page
+STREAM_CHUNK_SIZE = 500
+# rows inserted per transaction by the bulk endpoints, can be overridden with ?batch_size=
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 500))
+# seconds clients and proxies can keep the sitemap
+SITEMAP_MAX_AGE = 300
 
 class APIException(Exception):
     status_code = 400
@@ -20,18 +38,512 @@ def has_no_empty_params(rule):
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
-def generate_sitemap(app):
-    links = []
-    for rule in app.url_map.iter_rules():
-        # Filter out rules we can't navigate to in a browser
-        # and rules that require parameters
-        if "GET" in rule.methods and has_no_empty_params(rule):
-            url = url_for(rule.endpoint, **(rule.defaults or {}))
-            links.append(url)
+class Sitemap(object):
+    """
+    Route table and sitemap page, built once when the app is set up and served from memory
+    with an ETag, so the probes hitting / don't walk the url map on every request
+    """
+
+    def __init__(self, app):
+        self.routes = []
+        with app.test_request_context():
+            for rule in app.url_map.iter_rules():
+                # Filter out rules we can't navigate to in a browser
+                # and rules that require parameters
+                navigable = "GET" in rule.methods and has_no_empty_params(rule)
+                self.routes.append({
+                    "rule": rule.rule,
+                    "endpoint": rule.endpoint,
+                    "methods": sorted(rule.methods - {'HEAD', 'OPTIONS'}),
+                    "url": url_for(rule.endpoint, **(rule.defaults or {})) if navigable else None
+                })
+        self.html = render_sitemap([route["url"] for route in self.routes if route["url"]])
+        self.json = to_bytes(dumps({"routes": self.routes}))
+        self.etags = {
+            'text/html': hashlib.sha1(self.html.encode('utf-8')).hexdigest(),
+            'application/json': hashlib.sha1(self.json).hexdigest()
+        }
+        self.compressed = {}
+
+    def response(self, mimetype='text/html'):
+        etag = self.etags[mimetype]
+        matched = matched_etag(etag)
+        if matched is not None:
+            response = Response(status=304)
+            response.set_etag(matched)
+        else:
+            body = to_bytes(self.html) if mimetype == 'text/html' else self.json
+            encoding = negotiate()
+            if encoding is not None and len(body) >= MIN_SIZE:
+                # compressed once per encoding, like the bodies
+                if (mimetype, encoding) not in self.compressed:
+                    self.compressed[(mimetype, encoding)] = compress(body, encoding)
+                response = Response(self.compressed[(mimetype, encoding)], mimetype=mimetype,
+                                    headers={'Content-Encoding': encoding})
+            else:
+                response = Response(body, mimetype=mimetype)
+            response.set_etag(etag)
+        # the routes only change with a deploy
+        response.cache_control.public = True
+        response.cache_control.max_age = SITEMAP_MAX_AGE
+        return response
 
+def render_sitemap(links):
     links_html = "".join(["<li>" + y + "</li>" for y in links])
     return """
         <div style="text-align: center;">
         <img src='https://assets.breatheco.de/apis/img/4geeks/rigo-baby.jpg' />
         <h1>Hello Rigo!!</h1>
-        This is your api home, remember to specify a real endpoint path like: <ul style="text-align: left;">"""+links_html+"</ul></div>"
\ No newline at end of file
+        This is your api home, remember to specify a real endpoint path like: <ul style="text-align: left;">"""+links_html+"</ul></div>"
+
+def collection_response(model, filters=(), sorts=(), ranges=()):
+    """
+    Builds the GET response for a collection endpoint.
+    Without parameters it returns the whole table as a json list (the original behaviour).
+    ?limit=N&after=<cursor> returns one page using keyset pagination
+    as {"results": [...], "next": <cursor to pass as after, or null>}.
+    ?stream=ndjson or ?stream=json streams every row from a server-side cursor.
+    ?<column>=value filters on the columns listed in filters, comma separated values match any of them.
+    ?<column>_min=x&<column>_max=y filters on a range of the columns listed in ranges (both inclusive).
+    ?sort=col,-col orders by the columns listed in sorts, - for descending.
+    ?fields=key,key returns only those keys of the json objects.
+    ?ids=3,1,2 returns those rows in that order as {"results": [...], "missing": [ids not found]},
+    only fields applies to it.
+    """
+    stream = request.args.get('stream')
+    if stream is not None and stream not in ('json', 'ndjson'):
+        raise APIException('stream must be json or ndjson', status_code=400)
+    try:
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        raise APIException('limit must be an integer', status_code=400)
+    if limit is not None and not 0 < limit <= MAX_PAGE_SIZE:
+        raise APIException('limit must be between 1 and %d' % MAX_PAGE_SIZE, status_code=400)
+
+    serializer = SERIALIZERS[model]
+    if request.args.get('fields'):
+        fields = request.args['fields'].split(',')
+        unknown = [f for f in fields if f not in serializer.all_keys]
+        if unknown:
+            raise APIException('Unknown fields: %s' % ', '.join(unknown), status_code=400,
+                               payload={"allowed": list(serializer.all_keys)})
+        serializer = serializer.only(fields)
+
+    if 'ids' in request.args:
+        return batch_response(model, serializer, request.args['ids'])
+
+    order = parse_sort(model, sorts)
+    stmt = serializer.select(*[column for column, _ in order[:-1]]).order_by(
+        *[column.desc() if descending else column for column, descending in order])
+
+    criteria = parse_filters(filters) + parse_ranges(ranges)
+    if 'after' in request.args:
+        criteria.append(keyset_after(order, parse_cursor(request.args['after'], order)))
+    if criteria:
+        stmt = stmt.where(*criteria)
+
+    if stream:
+        return stream_response(serializer, stmt, stream, order, limit)
+
+    if limit is None:
+        if not serializer.nested:
+            # the flat lists skip the list of rows and the list of dicts of the whole table
+            return Response(serializer.encode(stmt, STREAM_CHUNK_SIZE), mimetype='application/json')
+        return json_response(serializer.fetch(stmt, all_rows=not criteria))
+
+    # fetch one extra row to know if there is a next page
+    rows = db.session.execute(stmt.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = make_cursor(keyset_values(serializer, order, last))
+    return json_response({
+        "results": serializer.serialize_rows(rows[:limit]),
+        "next": next_cursor
+    })
+
+def batch_response(model, serializer, ids):
+    """
+    Rows for a list of ids with one IN query, plus one query per nested list
+    """
+    ids = parse_ids(ids)
+    rows = db.session.execute(serializer.select().where(model.id.in_(ids))).all()
+    found = dict(zip([row[-1] for row in rows], serializer.serialize_rows(rows)))
+    return json_response({
+        "results": [found[i] for i in ids if i in found],
+        "missing": [i for i in ids if i not in found]
+    })
+
+def parse_ids(ids):
+    try:
+        ids = [int(i) for i in ids.split(',') if i.strip()]
+    except ValueError:
+        raise APIException('ids must be a comma separated list of integers', status_code=400)
+    if not 0 < len(ids) <= MAX_PAGE_SIZE:
+        raise APIException('ids must list between 1 and %d ids' % MAX_PAGE_SIZE, status_code=400)
+    # keep the requested order, without the repeated ids
+    return list(dict.fromkeys(ids))
+
+def bulk_delete(model, filters=()):
+    """
+    Deletes the rows matching ?ids= and the filters with one DELETE statement, without loading them.
+    At least one of them is required, a DELETE on the collection alone doesn't empty the table.
+    """
+    criteria = parse_filters(filters)
+    if 'ids' in request.args:
+        criteria.append(model.id.in_(parse_ids(request.args['ids'])))
+    if not criteria:
+        raise APIException('You need to specify the rows to delete with ids or a filter', status_code=400,
+                           payload={"filters": ['ids'] + [column.key for column in filters]})
+    deleted = db.session.execute(model.__table__.delete().where(*criteria)).rowcount
+    db.session.commit()
+    return jsonify({"deleted": deleted}), 200
+
+def parse_filters(columns):
+    criteria = []
+    for column in columns:
+        if column.key not in request.args:
+            continue
+        python_type = column.type.python_type
+        try:
+            values = [convert(value, python_type) for value in request.args[column.key].split(',')]
+        except (ValueError, InvalidOperation):
+            raise APIException('Invalid value for %s' % column.key, status_code=400)
+        criteria.append(column == values[0] if len(values) == 1 else column.in_(values))
+    return criteria
+
+def parse_ranges(columns):
+    criteria = []
+    for column in columns:
+        for suffix, compare in (('_min', column.__ge__), ('_max', column.__le__)):
+            if column.key + suffix not in request.args:
+                continue
+            try:
+                value = convert(request.args[column.key + suffix], column.type.python_type)
+            except (ValueError, InvalidOperation):
+                raise APIException('Invalid value for %s%s' % (column.key, suffix), status_code=400)
+            criteria.append(compare(value))
+    return criteria
+
+def convert(value, python_type):
+    if python_type is bool:
+        if value.lower() not in ('true', 'false', '1', '0'):
+            raise ValueError(value)
+        return value.lower() in ('true', '1')
+    return python_type(value)
+
+def parse_sort(model, columns):
+    """
+    Returns the (column, descending) pairs to order by, always ending with the primary key
+    so the order is stable and can be used as a keyset
+    """
+    allowed = dict((column.key, column) for column in columns)
+    order = []
+    for key in filter(None, request.args.get('sort', '').split(',')):
+        descending = key.startswith('-')
+        if key.lstrip('-') not in allowed:
+            raise APIException('Can not sort by %s' % key.lstrip('-'), status_code=400,
+                               payload={"allowed": sorted(allowed)})
+        order.append((allowed[key.lstrip('-')], descending))
+    order.append((model.id, False))
+    return order
+
+def keyset_after(order, values):
+    """
+    Condition for the rows that come after values in the given order:
+    (a > x) or (a = x and b > y) or ...
+    """
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        previous = [c == v for (c, _), v in zip(order[:i], values[:i])]
+        clauses.append(and_(*(previous + [column < values[i] if descending else column > values[i]])))
+    return or_(*clauses)
+
+def keyset_values(serializer, order, row):
+    """
+    Values of the order columns in a row of serializer.select(*sort columns)
+    """
+    width = len(serializer.keys)
+    return tuple(row[width:width + len(order) - 1]) + (row[-1],)
+
+def make_cursor(values):
+    # the default order only needs the id, keep that cursor a plain integer
+    if len(values) == 1:
+        return values[0]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def parse_cursor(cursor, order):
+    try:
+        if len(order) == 1:
+            return [int(cursor)]
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(order):
+            raise ValueError(cursor)
+        # decimals go through the json as strings
+        return [convert(str(value), column.type.python_type) if isinstance(value, str) else value
+                for value, (column, _) in zip(values, order)]
+    except (ValueError, TypeError, InvalidOperation):
+        raise APIException('Invalid after cursor', status_code=400)
+
+def stream_response(serializer, stmt, fmt, order, limit=None):
+    """
+    Streams the rows of a query as a chunked json list or as ndjson (one object per line)
+    without holding the whole result in memory
+    """
+    def generate():
+        first = True
+        for rows in stream_partitions(serializer, stmt, order, limit):
+            items = [dumps(item) for item in serializer.serialize_rows(rows)]
+            if fmt == 'ndjson':
+                yield b"\n".join(to_bytes(i) for i in items) + b"\n"
+            else:
+                yield (b"[" if first else b",") + b",".join(to_bytes(i) for i in items)
+            first = False
+        if fmt == 'json':
+            yield b"[]" if first else b"]"
+
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+def stream_partitions(serializer, stmt, order, limit=None):
+    """
+    Yields the rows of stmt STREAM_CHUNK_SIZE at a time.
+    Flat rows come from a server-side cursor. The nested lists are queried for every chunk and
+    a connection can't run a query while its server-side cursor is open (mysqlclient answers
+    "Commands out of sync"), so serializers with nested lists read keyset pages instead.
+    """
+    if not serializer.nested:
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=STREAM_CHUNK_SIZE))
+        for rows in result.partitions():
+            yield rows
+        return
+
+    page = stmt
+    while limit is None or limit > 0:
+        size = STREAM_CHUNK_SIZE if limit is None else min(STREAM_CHUNK_SIZE, limit)
+        rows = db.session.execute(page.limit(size)).all()
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+        if limit is not None:
+            limit -= len(rows)
+        page = stmt.where(keyset_after(order, keyset_values(serializer, order, rows[-1])))
+
+def read_bulk_rows():
+    """
+    Reads the body of a bulk request, either a json array or ndjson (one object per line).
+    Returns the parsed rows and the errors of the lines that could not be parsed.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        rows, errors = [], []
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                errors.append({"row": len(rows), "message": "Invalid json"})
+                rows.append(None)
+        return rows, errors
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, list):
+        raise APIException("You need to specify the request body as a json array or ndjson", status_code=400)
+    return body, []
+
+def bulk_create(model, required):
+    """
+    Creates many rows of a model in one request.
+    Every row is validated before anything is written, then the rows are inserted
+    with executemany in batches of ?batch_size= rows, one transaction per batch.
+    A batch the database rejects is inserted again a row at a time, so only the failing
+    rows are left out and reported.
+    required maps the mandatory fields to their error message, the other non nullable
+    columns are checked too.
+    """
+    rows, errors = read_bulk_rows()
+    try:
+        batch_size = int(request.args.get('batch_size', BULK_BATCH_SIZE))
+    except ValueError:
+        raise APIException('batch_size must be an integer', status_code=400)
+    if batch_size < 1:
+        raise APIException('batch_size must be greater than 0', status_code=400)
+
+    # the version column is managed by the database
+    columns = [c for c in model.__table__.columns if not c.primary_key and c.name != 'version']
+    messages = dict(required)
+    for c in columns:
+        if not c.nullable and c.default is None and c.server_default is None:
+            messages.setdefault(c.name, 'You need to specify %s' % c.name)
+
+    # the database only finds a value repeated inside the payload once the batch fails
+    seen = dict((c.name, {}) for c in columns if c.unique)
+    values = []
+    for i, row in enumerate(rows):
+        if row is None:
+            continue
+        if not isinstance(row, dict):
+            errors.append({"row": i, "message": "Each row must be a json object"})
+            continue
+        value = {}
+        for c in columns:
+            if row.get(c.name) is None:
+                if c.name in messages:
+                    errors.append({"row": i, "message": messages[c.name]})
+                value[c.name] = None
+                continue
+            value[c.name], message = check_value(c, c.name, row[c.name])
+            if message is not None:
+                errors.append({"row": i, "message": message})
+            elif c.name in seen:
+                if value[c.name] in seen[c.name]:
+                    errors.append({"row": i, "message": '%s is the same as in row %d' % (
+                        c.name, seen[c.name][value[c.name]])})
+                else:
+                    seen[c.name][value[c.name]] = i
+        values.append((i, value))
+    if errors:
+        raise APIException('Some rows are invalid, nothing was inserted', status_code=400, payload={"errors": errors})
+
+    inserted = 0
+    for start in range(0, len(values), batch_size):
+        batch = values[start:start + batch_size]
+        error = insert_rows(model, [value for _, value in batch])
+        if error is None:
+            inserted += len(batch)
+            continue
+        for i, value in batch:
+            error = insert_rows(model, [value]) if len(batch) > 1 else error
+            if error is None:
+                inserted += 1
+            else:
+                errors.append({"row": i, "message": error})
+
+    return jsonify({"inserted": inserted, "errors": errors}), 207 if errors else 200
+
+def insert_rows(model, rows):
+    """
+    Inserts the rows in one transaction, returns the database error or None
+    """
+    try:
+        db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return str(getattr(e, 'orig', None) or e)
+    return None
+
+def patch_response(model, ident, fields):
+    """
+    Partial update of one row with a single UPDATE ... WHERE id = ?, fields lists the columns
+    the body may change. The row comes back from the UPDATE itself (RETURNING) when the database
+    supports it, otherwise it is selected again. Prefer: return=minimal answers 204 without the row.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not body:
+        raise APIException("You need to specify the changed fields as a json object", status_code=400)
+    values = patch_values(fields, body)
+    serializer = SERIALIZERS[model]
+    minimal = 'return=minimal' in request.headers.get('Prefer', '')
+
+    table = model.__table__
+    # bumping the version keeps the ETags and the optimistic locking of the ORM updates working
+    stmt = table.update().where(table.c.id == ident).values(version=table.c.version + 1, **values)
+    try:
+        if minimal:
+            rows = None
+            found = db.session.execute(stmt).rowcount > 0
+        elif db.engine.dialect.update_returning:
+            rows = db.session.execute(stmt.returning(*(serializer.columns + [model.id]))).all()
+            found = bool(rows)
+        else:
+            found = db.session.execute(stmt).rowcount > 0
+            rows = db.session.execute(serializer.select().where(model.id == ident)).all() if found else None
+        if not found:
+            db.session.rollback()
+            raise APIException('%s not found' % model.__name__, status_code=404)
+        # the nested lists are read in the same transaction
+        item = serializer.serialize_rows(rows)[0] if rows else None
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        raise APIException(str(getattr(e, 'orig', None) or e), status_code=409)
+
+    if minimal:
+        return "", 204, {'Preference-Applied': 'return=minimal'}
+    return json_response(item)
+
+def patch_values(fields, body):
+    """
+    Checks the body of a PATCH against the types, lengths and nullability of the columns,
+    returns the values to set keyed by column name
+    """
+    allowed = dict((field.key, field.expression) for field in fields)
+    unknown = [key for key in body if key not in allowed]
+    if unknown:
+        raise APIException('Unknown fields: %s' % ', '.join(unknown), status_code=400,
+                           payload={"allowed": sorted(allowed)})
+    values, errors = {}, []
+    for key, value in body.items():
+        column = allowed[key]
+        values[column.name], message = check_value(column, key, value)
+        if message is not None:
+            errors.append({"field": key, "message": message})
+    if errors:
+        raise APIException('Some fields are invalid, nothing was changed', status_code=400, payload={"errors": errors})
+    return values
+
+def check_value(column, key, value):
+    """
+    Checks a json value against the type, length and nullability of a column,
+    returns the value to store and the error message, None when it is valid
+    """
+    python_type = column.type.python_type
+    if value is None:
+        return None, (None if column.nullable else '%s can not be null' % key)
+    if python_type is Decimal:
+        return check_numeric(column, key, value)
+    if python_type is bool:
+        return value, (None if isinstance(value, bool) else '%s must be true or false' % key)
+    if python_type is int:
+        valid = isinstance(value, int) and not isinstance(value, bool)
+        return value, (None if valid else '%s must be an integer' % key)
+    if not isinstance(value, str):
+        return value, '%s must be a string' % key
+    if column.type.length is not None and len(value) > column.type.length:
+        return value, '%s is longer than %d characters' % (key, column.type.length)
+    return value, None
+
+def check_numeric(column, key, value):
+    """
+    Reads a value with parse_decimal and checks it fits the precision and scale of a Numeric column,
+    the only ones are prices so a negative value is refused too. Returns the value and the error message.
+    """
+    number = parse_decimal(value)
+    if number is None:
+        return None, '%s must be a number' % key
+    if number < 0:
+        return number, '%s can not be negative' % key
+    precision, scale = column.type.precision, column.type.scale or 0
+    # postgres and mysql refuse what doesn't fit, sqlite would store it as it is
+    if precision is not None and number >= 10 ** (precision - scale):
+        return number, '%s must be less than %d' % (key, 10 ** (precision - scale))
+    if number != number.quantize(Decimal(1).scaleb(-scale)):
+        return number, '%s can have at most %d decimals' % (key, scale)
+    return number, None
+
+def parse_decimal(value):
+    """
+    Reads a price like 12.5, "12.50" or "$1,299.99", returns None if it isn't a number
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        number = Decimal(str(value).strip().lstrip('$').replace(',', ''))
+    except InvalidOperation:
+        return None
+    return number if number.is_finite() else None
@@ -0,0 +1,192 @@
+"""
+Write-behind queue for writes that can be applied a little later, like creating a picture.
+A request opts in with the header Prefer: respond-async, the write is queued and the request
+gets a 202 with a tracking id right away. A background thread applies the queued writes in
+batches, one transaction per batch, and records the outcome of each write for GET /writes/<id>.
+The queue is bounded, when it is full a request waits up to WRITE_BEHIND_ENQUEUE_TIMEOUT seconds
+and then gets a 503, and the writes still queued are applied before the process exits.
+"""
+import os
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import weakref
+from flask import request
+from cache import LRUCache, SharedCache
+from models import db
+from threads import ensure_thread
+from serializers import dumps
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = int(os.environ.get('WRITE_BEHIND_QUEUE_SIZE', 10000))
+BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 200))
+ENQUEUE_TIMEOUT = float(os.environ.get('WRITE_BEHIND_ENQUEUE_TIMEOUT', 1))
+# how long the outcome of a write can be looked up
+STATUS_TTL = int(os.environ.get('WRITE_BEHIND_STATUS_TTL', 3600))
+
+_STOP = object()
+# the queues drained before the process exits, every create_app() calls init_app()
+_QUEUES = weakref.WeakSet()
+
+
+class QueueFull(Exception):
+    pass
+
+
+class WriteBehindQueue(object):
+
+    def __init__(self, status_backend=None, maxsize=QUEUE_SIZE, batch_size=BATCH_SIZE):
+        self.app = None
+        self.writers = {}
+        self.queue = queue.Queue(maxsize)
+        self.batch_size = batch_size
+        # outcomes are stored as ready made json responses, the shared backend lets any worker answer
+        self.statuses = status_backend if status_backend is not None else LRUCache(100000, ttl=STATUS_TTL)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.closed = False
+        self.counters = {"accepted": 0, "rejected": 0, "applied": 0, "failed": 0, "batches": 0}
+
+    def init_app(self, app):
+        self.app = app
+        _QUEUES.add(self)
+
+    def writer(self, kind):
+        """
+        Decorator registering the function that applies a kind of write, it gets the queued payload,
+        changes the session without committing and raises to fail the write
+        """
+        def decorator(func):
+            self.writers[kind] = func
+            return func
+        return decorator
+
+    def requested(self):
+        return 'respond-async' in request.headers.get('Prefer', '')
+
+    def submit(self, kind, payload):
+        """
+        Queues a write and returns its tracking id, raises QueueFull when the queue stays full
+        """
+        if self.closed:
+            raise QueueFull('The server is shutting down')
+        self.start()
+        tracking_id = uuid.uuid4().hex
+        self.set_status(tracking_id, "queued")
+        try:
+            self.queue.put((tracking_id, kind, payload), timeout=ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self.count("rejected")
+            self.statuses.delete(tracking_id)
+            raise QueueFull('Too many queued writes, try again later')
+        self.count("accepted")
+        return tracking_id
+
+    def start(self):
+        with self.lock:
+            self.thread = ensure_thread(self.thread, self.run, 'write-behind')
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            # whatever queued up while the previous batch was committed goes in this one
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self.flush(batch)
+            if stop:
+                return
+
+    def flush(self, batch):
+        with self.app.app_context():
+            try:
+                for tracking_id, kind, payload in batch:
+                    self.writers[kind](payload)
+                db.session.commit()
+            except Exception as error:
+                db.session.rollback()
+                if len(batch) > 1:
+                    # find the write that failed, the others still go through
+                    for item in batch:
+                        self.flush([item])
+                    return
+                logger.warning('write-behind %s %s failed: %s', batch[0][1], batch[0][0], error)
+                self.set_status(batch[0][0], "failed", str(error))
+                self.count("failed")
+                return
+            finally:
+                db.session.remove()
+        for tracking_id, kind, payload in batch:
+            self.set_status(tracking_id, "done")
+        self.count("applied", len(batch))
+        self.count("batches")
+
+    def set_status(self, tracking_id, status, error=None):
+        data = {"trackingId": tracking_id, "status": status}
+        if error is not None:
+            data["error"] = error
+        self.statuses.set(tracking_id, (dumps(data), 200, 'application/json'))
+
+    def status(self, tracking_id):
+        """
+        Returns (json body, status code, mimetype) or None for an unknown id
+        """
+        return self.statuses.get(tracking_id)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def stats(self):
+        with self.lock:
+            data = dict(self.counters)
+        data.update({"queued": self.queue.qsize(), "maxsize": self.queue.maxsize, "batchSize": self.batch_size})
+        return data
+
+    def close(self, timeout=30):
+        """
+        Stops accepting writes and waits for the queued ones to be applied
+        """
+        self.closed = True
+        if self.thread is None or not self.thread.is_alive():
+            return
+        deadline = time.time() + timeout
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning('write-behind queue did not drain, %d writes lost', self.queue.qsize())
+            return
+        self.thread.join(max(0, deadline - time.time()))
+
+
+def _close_queues():
+    for write_queue in list(_QUEUES):
+        write_queue.close()
+
+
+# registered once for the process, it drains the queues still alive
+atexit.register(_close_queues)
+
+
+def write_queue_from_env():
+    """
+    WRITE_BEHIND_STATUS=shared keeps the write outcomes in a sqlite file, so any worker process
+    on the host can answer GET /writes/<id>, the default keeps them in the process that queued the write
+    """
+    if os.environ.get('WRITE_BEHIND_STATUS') == 'shared':
+        return WriteBehindQueue(SharedCache(os.environ.get('WRITE_BEHIND_STATUS_PATH'), ttl=STATUS_TTL))
+    return WriteBehindQueue()
@@ -1,7 +1,11 @@
 # This file was created to run the application on heroku using gunicorn.
 # Read more about it here: https://devcenter.heroku.com/articles/python-gunicorn
 
-from main import app as application
+from main import create_app
+
+# only what serving needs, see create_app(). Works with gunicorn --preload, the workers
+# then share the imported code and open their own database connections.
+application = create_app(tooling=False)
 
 if __name__ == "__main__":
     application.run()
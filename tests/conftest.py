@@ -0,0 +1,122 @@
+"""
+Fixtures for the behaviour tests: the app from create_app() on a scratch SQLite file, a client,
+a helper seeding rows and a statement counter. Timings are measured in benchmarks/, not here.
+
+    $ python -m pytest tests
+"""
+import os
+import sys
+from decimal import Decimal
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+
+# read when passwords.py is imported, the tests don't need a slow hash
+os.environ.setdefault('PASSWORD_HASH_ITERATIONS', '1000')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # create_app() reads the connection string from the environment
+    monkeypatch.setenv('DB_CONNECTION_STRING', 'sqlite:///%s' % tmp_path.joinpath('test.db'))
+    import main
+    from models import db
+    from auth import TOKENS
+
+    app = main.create_app(tooling=False)
+    with app.app_context():
+        db.create_all()
+    # the caches are module globals shared by every app, each test starts with them empty
+    if main.CACHE.backend is not None:
+        main.CACHE.backend.clear()
+    TOKENS.clear()
+    # a full re-sync on the next search
+    main.SEARCH_INDEX.table_state = None
+    main.SEARCH_INDEX.stale = True
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def seed(app):
+    """
+    seed(users=, addresses_per_user=, products=, pictures_per_product=) empties the tables and inserts
+    users named user<n> with the password secret<n>, stored as plain text like the rows made before hashing
+    """
+    from models import db, User, Product, Address, BillingAddress, Picture
+
+    def seed(users=0, addresses_per_user=1, products=0, pictures_per_product=1):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            if users:
+                db.session.execute(User.__table__.insert(), [{
+                    "id": i, "userFirstName": "First%d" % i, "userLastName": "Last%d" % i,
+                    "userName": "user%d" % i, "email": "user%d@example.com" % i,
+                    "password": "secret%d" % i
+                } for i in range(1, users + 1)])
+            if users and addresses_per_user:
+                db.session.execute(Address.__table__.insert(), [{
+                    "userStreet": "Main St", "userNumber": str(j), "userCity": "Miami", "userState": "FL",
+                    "userZipCode": "33101", "isBillingAddress": True, "person_id": i
+                } for i in range(1, users + 1) for j in range(addresses_per_user)])
+                db.session.execute(BillingAddress.__table__.insert(), [{
+                    "billingStreet": "Main St", "billingNumber": str(j), "billingCity": "Miami",
+                    "billingState": "FL", "billingZipCode": "33101", "person_id": i
+                } for i in range(1, users + 1) for j in range(addresses_per_user)])
+            if products:
+                db.session.execute(Product.__table__.insert(), [{
+                    "id": i, "productName": "Product %d" % i, "productDescription": "Description %d" % i,
+                    "productPrice": Decimal("%d.99" % (i % 100)), "productCategory": "category%d" % (i % 3),
+                    "productAgeRange": "3-6"
+                } for i in range(1, products + 1)])
+            if products and pictures_per_product:
+                db.session.execute(Picture.__table__.insert(), [{
+                    "picture_url": "https://example.com/%d/%d.jpg" % (i, j), "photos_id": i
+                } for i in range(1, products + 1) for j in range(pictures_per_product)])
+            db.session.commit()
+    return seed
+
+
+@pytest.fixture
+def auth(client):
+    """
+    auth() logs user1 in and returns the Authorization header, seed() the users first
+    """
+    def auth():
+        response = client.post('/login', json={
+            "userName": "user1", "email": "user1@example.com", "password": "secret1"})
+        assert response.status_code == 200
+        return {'Authorization': 'Bearer %s' % response.get_json()['jwt']}
+    return auth
+
+
+@pytest.fixture
+def statements(app):
+    """
+    with statements() as executed: collects the SQL statements sent inside the block
+    """
+    from models import db
+
+    with app.app_context():
+        engine = db.engine
+
+    @contextmanager
+    def statements():
+        executed = []
+
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            executed.append(statement)
+        event.listen(engine, 'before_cursor_execute', on_execute)
+        try:
+            yield executed
+        finally:
+            event.remove(engine, 'before_cursor_execute', on_execute)
+    return statements
@@ -0,0 +1,122 @@
+import gzip
+import warnings
+import pytest
+import main
+
+
+def test_spec_is_served_by_the_first_app(monkeypatch, tmp_path):
+    monkeypatch.setenv('DB_CONNECTION_STRING', 'sqlite:///%s' % tmp_path.joinpath('spec.db'))
+    with warnings.catch_warnings():
+        # flask 2.3 raises where 2.2 warns about a route added to a registered blueprint
+        warnings.simplefilter('error', UserWarning)
+        app = main.create_app()
+    assert '/spec' in [rule.rule for rule in app.url_map.iter_rules()]
+    response = app.test_client().get('/spec')
+    assert response.status_code == 200 and 'paths' in response.get_json()
+
+
+def test_workers_have_no_spec(app, client):
+    assert client.get('/spec').status_code == 404
+
+
+@pytest.fixture
+def profiling(monkeypatch):
+    # read by create_app(), goes before the app fixture
+    monkeypatch.setenv('PROFILING', '1')
+
+
+def test_profiling_times_compression(profiling, client, seed):
+    seed(products=50)
+    response = client.get('/product', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    phases = [item.split(';')[0].strip() for item in response.headers['Server-Timing'].split(',')]
+    assert phases == ['sql', 'serialize', 'compress', 'total']
+    metrics = client.get('/metrics').get_json()['GET /product']
+    assert metrics['compressMs'] > 0
+
+
+def test_foreign_keys_only_on_the_app_engines(app):
+    from sqlalchemy import create_engine, text
+    from models import db
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert connection.execute(text('PRAGMA foreign_keys')).scalar() == 1
+        # alembic's engine, its batch migrations rebuild referenced tables
+        with create_engine(app.config['SQLALCHEMY_DATABASE_URI']).connect() as connection:
+            assert connection.execute(text('PRAGMA foreign_keys')).scalar() == 0
+
+
+def test_sitemap(client):
+    response = client.get('/')
+    assert response.status_code == 200 and response.mimetype == 'text/html'
+    assert '<li>/health</li>' in response.get_data(as_text=True)
+    assert response.cache_control.public and response.cache_control.max_age == 300
+    routes = client.get('/sitemap.json').get_json()['routes']
+    product = [route for route in routes if route['rule'] == '/product/<int:product_id>'][0]
+    # routes with parameters have no link
+    assert product['url'] is None and 'PUT' in product['methods'] and 'HEAD' not in product['methods']
+    assert {'rule': '/health', 'endpoint': 'api.health', 'methods': ['GET'], 'url': '/health'} in routes
+
+
+def test_sitemap_etags_and_compression(client):
+    for url in ('/', '/sitemap.json'):
+        response = client.get(url)
+        again = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+        assert again.status_code == 304 and again.get_data() == b''
+    # the page is under COMPRESSION_MIN_SIZE, the route table isn't
+    assert 'Content-Encoding' not in client.get('/', headers={'Accept-Encoding': 'gzip'}).headers
+    compressed = client.get('/sitemap.json', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.get_data()) == client.get('/sitemap.json').get_data()
+    assert client.get('/').headers['ETag'] != client.get('/sitemap.json').headers['ETag']
+
+
+def test_shallow_health_check_does_not_touch_the_database(client, statements):
+    with statements() as executed:
+        response = client.get('/health')
+    assert response.get_json() == {"status": "ok"} and not executed
+    assert response.cache_control.no_store
+
+
+def test_deep_health_check(client, statements, monkeypatch):
+    with statements() as executed:
+        response = client.get('/health?deep=1')
+    assert response.status_code == 200 and executed == ['SELECT 1']
+    assert response.get_json()['database'] == 'ok' and response.get_json()['databaseMs'] >= 0
+
+    from sqlalchemy.exc import OperationalError
+    from models import db
+
+    def down(*args, **kwargs):
+        raise OperationalError('SELECT 1', {}, Exception('database is down'))
+    monkeypatch.setattr(db.session, 'execute', down)
+    response = client.get('/health?deep=true')
+    assert response.status_code == 503
+    assert response.get_json() == {"status": "error", "database": "OperationalError"}
+    assert client.get('/health').status_code == 200
+
+
+def test_process_hooks_are_registered_once(monkeypatch, tmp_path):
+    import os
+    import atexit
+    hooks = []
+    monkeypatch.setattr(os, 'register_at_fork', lambda **kwargs: hooks.append(kwargs))
+    monkeypatch.setattr(atexit, 'register', lambda func: hooks.append(func))
+    monkeypatch.setenv('DB_CONNECTION_STRING', 'sqlite:///%s' % tmp_path.joinpath('hooks.db'))
+    apps = [main.create_app(tooling=False) for _ in range(3)]
+    assert hooks == [] and len(apps) == 3
+
+
+def test_a_forked_child_drops_the_pools_of_every_app(app, monkeypatch, tmp_path):
+    import pool
+    from models import db
+    monkeypatch.setenv('DB_CONNECTION_STRING', 'sqlite:///%s' % tmp_path.joinpath('other.db'))
+    other = main.create_app(tooling=False)
+    pools = {}
+    for each in (app, other):
+        with each.app_context():
+            pools[each] = db.engine.pool
+    pool._reset_pools()
+    for each in (app, other):
+        with each.app_context():
+            assert db.engine.pool is not pools[each]
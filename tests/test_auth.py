@@ -0,0 +1,71 @@
+import time
+import datetime
+import pytest
+from flask_jwt_simple import create_jwt
+import auth
+from cache import LRUCache
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    """
+    The tokens whose signature auth.py checked
+    """
+    decoded = []
+    decode_jwt = auth.decode_jwt
+
+    def counting(encoded_token):
+        decoded.append(encoded_token)
+        return decode_jwt(encoded_token=encoded_token)
+    monkeypatch.setattr(auth, 'decode_jwt', counting)
+    return decoded
+
+
+def token_for(app, identity='user1'):
+    with app.test_request_context():
+        return create_jwt(identity=identity)
+
+
+def test_a_token_is_verified_once(app, client, seed, decodes):
+    seed(users=1)
+    headers = {'Authorization': 'Bearer %s' % token_for(app)}
+    for _ in range(3):
+        assert client.get('/user/1', headers=headers).status_code == 200
+    assert len(decodes) == 1
+    assert client.get('/user/1', headers={'Authorization': 'Bearer %s' % token_for(app, 'user2')}).status_code == 200
+    assert len(decodes) == 2
+
+
+def test_a_cached_token_is_checked_again_after_its_exp(app, decodes, monkeypatch):
+    # expires before the cache entry does
+    app.config['JWT_EXPIRES'] = datetime.timedelta(seconds=60)
+    monkeypatch.setattr(auth, 'TOKENS', LRUCache(10, ttl=300))
+    token = token_for(app)
+    with app.test_request_context():
+        claims = auth.verify_token(token)
+        auth.verify_token(token)
+        assert len(decodes) == 1
+        monkeypatch.setattr(time, 'time', lambda: claims['exp'] + 1)
+        auth.verify_token(token)
+    assert len(decodes) == 2
+
+
+def test_an_expired_token_is_rejected(app, client, seed):
+    seed(users=1)
+    app.config['JWT_EXPIRES'] = datetime.timedelta(seconds=-10)
+    response = client.get('/user/1', headers={'Authorization': 'Bearer %s' % token_for(app)})
+    assert response.status_code == 401
+    assert len(auth.TOKENS) == 0
+
+
+def test_the_cache_keeps_at_most_maxsize_tokens(app, decodes, monkeypatch):
+    monkeypatch.setattr(auth, 'TOKENS', LRUCache(2, ttl=300))
+    tokens = [token_for(app, 'user%d' % i) for i in range(3)]
+    with app.test_request_context():
+        for token in tokens:
+            auth.verify_token(token)
+        assert len(auth.TOKENS) == 2
+        # the least recently used one was dropped
+        auth.verify_token(tokens[2])
+        auth.verify_token(tokens[0])
+    assert decodes == tokens + [tokens[0]]
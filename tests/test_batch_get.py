@@ -0,0 +1,36 @@
+import utils
+
+
+def test_ids_come_back_in_the_requested_order(client, seed):
+    seed(users=5, addresses_per_user=2, products=5)
+    body = client.get('/product?ids=3,1,2').get_json()
+    assert [p['ProductId'] for p in body['results']] == [3, 1, 2] and body['missing'] == []
+    # the nested lists too
+    body = client.get('/user?ids=5,2').get_json()
+    assert [u['userid'] for u in body['results']] == [5, 2]
+    assert [len(u['addresses']) for u in body['results']] == [2, 2]
+
+
+def test_missing_and_repeated_ids(client, seed):
+    seed(products=5)
+    body = client.get('/product?ids=4,99,4,1,98,99').get_json()
+    assert [p['ProductId'] for p in body['results']] == [4, 1]
+    assert body['missing'] == [99, 98]
+
+
+def test_ids_with_fields(client, seed):
+    seed(products=3)
+    body = client.get('/product?ids=2,1&fields=ProductName').get_json()
+    assert body['results'] == [{"ProductName": "Product 2"}, {"ProductName": "Product 1"}]
+
+
+def test_invalid_id_lists(client, seed, statements):
+    seed(products=3)
+    assert client.get('/product?ids=1,two').status_code == 400
+    assert client.get('/product?ids=').status_code == 400
+    ids = ','.join(str(i) for i in range(1, utils.MAX_PAGE_SIZE + 2))
+    with statements() as executed:
+        response = client.get('/product?ids=%s' % ids)
+    assert response.status_code == 400 and not [s for s in executed if 'FROM products' in s]
+    ids = ','.join(str(i) for i in range(1, utils.MAX_PAGE_SIZE + 1))
+    assert client.get('/product?ids=%s' % ids).get_json()['missing'] == list(range(4, utils.MAX_PAGE_SIZE + 1))
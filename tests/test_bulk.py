@@ -0,0 +1,46 @@
+def product(i, **extra):
+    return dict({"productName": "Bulk %d" % i, "productPrice": "%d.50" % i}, **extra)
+
+
+def test_bulk_create_inserts_every_batch(client, seed):
+    seed()
+    response = client.post('/product/bulk?batch_size=3', json=[product(i) for i in range(10)])
+    assert response.status_code == 200 and response.get_json() == {"inserted": 10, "errors": []}
+    assert len(client.get('/product').get_json()) == 10
+
+
+def test_bulk_create_reports_the_failing_row_only(client, seed):
+    seed(products=5)
+    rows = [product(i) for i in range(10)]
+    # already in the table, only the database finds it
+    rows[4]["productName"] = "Product 2"
+    response = client.post('/product/bulk?batch_size=3', json=rows)
+    assert response.status_code == 207
+    body = response.get_json()
+    assert body["inserted"] == 9
+    assert [error["row"] for error in body["errors"]] == [4]
+    names = set(p["ProductName"] for p in client.get('/product').get_json())
+    assert set("Bulk %d" % i for i in range(10) if i != 4) <= names
+
+
+def test_bulk_create_rejects_repeated_unique_values(client, seed):
+    seed()
+    rows = [product(1), product(2), product(1, productPrice="3")]
+    response = client.post('/product/bulk', json=rows)
+    assert response.status_code == 400
+    assert response.get_json()["errors"] == [{"row": 2, "message": "productName is the same as in row 0"}]
+    assert client.get('/product').get_json() == []
+
+
+def test_bulk_create_checks_types_and_lengths(client, seed):
+    seed(users=1)
+    address = {"userStreet": "Main St", "userNumber": "1", "userCity": "Miami", "userState": "FL",
+               "userZipCode": "33101", "person_id": 1}
+    rows = [address, dict(address, userZipCode="1" * 13), dict(address, person_id="one"),
+            dict(address, isBillingAddress="yes")]
+    response = client.post('/address/bulk', json=rows)
+    assert response.status_code == 400
+    assert [(e["row"], e["message"]) for e in response.get_json()["errors"]] == [
+        (1, "userZipCode is longer than 12 characters"),
+        (2, "person_id must be an integer"),
+        (3, "isBillingAddress must be true or false")]
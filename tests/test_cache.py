@@ -0,0 +1,72 @@
+import sqlite3
+from models import db
+
+
+def write_from_another_process(app, sql):
+    # a plain connection, none of this process's session events see the write
+    with app.app_context():
+        path = db.engine.url.database
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute(sql)
+        conn.execute("UPDATE table_changes SET changes = changes + 1 WHERE table_name = 'products'")
+    conn.close()
+
+
+def test_cached_product_is_not_served_after_another_process_writes(app, client, seed):
+    seed(products=2)
+    first = client.get('/product/1')
+    assert first.headers['X-Cache'] == 'MISS'
+    assert client.get('/product/1').headers['X-Cache'] == 'HIT'
+
+    write_from_another_process(app, "UPDATE products SET productName = 'Renamed', version = version + 1 WHERE id = 1")
+    response = client.get('/product/1', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200 and response.headers['X-Cache'] == 'MISS'
+    assert response.get_json()['ProductName'] == 'Renamed'
+    assert response.headers['ETag'] != first.headers['ETag']
+    assert client.get('/product/1', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_cached_list_is_not_served_after_another_process_writes(app, client, seed):
+    seed(products=2)
+    assert len(client.get('/product').get_json()) == 2
+    assert client.get('/product').headers['X-Cache'] == 'HIT'
+    write_from_another_process(app, "INSERT INTO products (productName, productPrice) VALUES ('New', 1)")
+    response = client.get('/product')
+    assert response.headers['X-Cache'] == 'MISS' and len(response.get_json()) == 3
+
+
+def test_writes_of_this_process_drop_the_entries(client, seed):
+    seed(products=2)
+    client.get('/product/1')
+    client.get('/product')
+    assert client.put('/product/1', json={"productName": "Renamed"}).status_code == 200
+    response = client.get('/product')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.get_json()[0]['ProductName'] == 'Renamed'
+
+
+def test_shared_cache_purges_expired_entries(tmp_path, monkeypatch):
+    import time
+    from cache import SharedCache
+    cache = SharedCache(str(tmp_path.joinpath('cache.db')), ttl=60, purge_every=3)
+    now = time.time()
+    cache.set('old', (b'1', 200, 'application/json'))
+    monkeypatch.setattr(time, 'time', lambda: now + 120)
+    cache.set('new', (b'2', 200, 'application/json'))
+    assert len(cache) == 2 and cache.get('old') is None
+    # the third write deletes the expired rows
+    cache.set('newer', (b'3', 200, 'application/json'))
+    assert len(cache) == 2 and cache.get('new') == (b'2', 200, 'application/json')
+
+
+def test_shared_cache_keeps_a_connection_per_thread(tmp_path):
+    import threading
+    from cache import SharedCache
+    cache = SharedCache(str(tmp_path.joinpath('cache.db')))
+    assert cache._connect() is cache._connect()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(cache._connect()))
+    thread.start()
+    thread.join()
+    assert other[0] is not cache._connect()
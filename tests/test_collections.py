@@ -0,0 +1,114 @@
+import json
+import pytest
+import utils
+
+
+@pytest.mark.parametrize('path', ['/user', '/product', '/address'])
+def test_stream_matches_the_list(client, seed, monkeypatch, path):
+    # several chunks, the last one partial
+    monkeypatch.setattr(utils, 'STREAM_CHUNK_SIZE', 4)
+    seed(users=10, addresses_per_user=2, products=10, pictures_per_product=2)
+    expected = client.get(path).get_json()
+    assert json.loads(client.get(path + '?stream=json').get_data()) == expected
+    lines = client.get(path + '?stream=ndjson').get_data().decode('utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == expected
+
+
+def test_stream_nested_pages_keep_sort_and_limit(client, seed, monkeypatch):
+    monkeypatch.setattr(utils, 'STREAM_CHUNK_SIZE', 3)
+    seed(users=10, addresses_per_user=1)
+    streamed = json.loads(client.get('/user?stream=json&sort=-userName&limit=7').get_data())
+    assert [user['userName'] for user in streamed] == sorted(['user%d' % i for i in range(1, 11)], reverse=True)[:7]
+    assert all(len(user['addresses']) == 1 for user in streamed)
+
+
+
+@pytest.mark.parametrize('path', ['/address', '/billingaddress', '/picture'])
+def test_partitioned_lists_match_the_orm(app, client, seed, monkeypatch, path):
+    from models import Address, BillingAddress, Picture
+    from serializers import SERIALIZERS
+    model = {'/address': Address, '/billingaddress': BillingAddress, '/picture': Picture}[path]
+    monkeypatch.setattr(utils, 'STREAM_CHUNK_SIZE', 4)
+    seed(users=10, addresses_per_user=1, products=10, pictures_per_product=1)
+    body = client.get(path).get_json()
+    with app.test_request_context():
+        assert body == [row.serialize() for row in model.query.order_by(model.id)]
+        serializer = SERIALIZERS[model]
+        assert body == serializer.fetch(serializer.select().order_by(model.id), all_rows=True)
+
+
+def set_prices(app, prices):
+    """
+    Product i gets prices[i % len(prices)], several products share each price
+    """
+    from decimal import Decimal
+    from models import db, Product
+    with app.app_context():
+        for product in Product.query:
+            product.productPrice = Decimal(prices[product.id % len(prices)])
+        db.session.commit()
+
+
+def test_filters(client, seed):
+    seed(users=3, addresses_per_user=2, products=9)
+    products = client.get('/product?productCategory=category1').get_json()
+    assert [p['ProductId'] for p in products] == [1, 4, 7]
+    # comma separated values match any of them
+    products = client.get('/product?productCategory=category1,category2&productName=Product 2,Product 4').get_json()
+    assert [p['ProductId'] for p in products] == [2, 4]
+    assert [a['user'] for a in client.get('/address?person_id=2').get_json()] == [2, 2]
+    assert client.get('/address?person_id=two').status_code == 400
+
+
+def test_ranges(app, client, seed):
+    seed(products=9)
+    set_prices(app, ['1.50', '2.50', '3.50'])
+    products = client.get('/product?productPrice_min=2.50&productPrice_max=3.5').get_json()
+    assert sorted(p['productPrice'] for p in products) == ['2.50'] * 3 + ['3.50'] * 3
+    assert client.get('/product?productPrice_min=cheap').status_code == 400
+
+
+def test_sort(client, seed):
+    seed(users=3, products=12)
+    names = [p['ProductName'] for p in client.get('/product?sort=-productName').get_json()]
+    assert names == sorted(names, reverse=True)
+    users = client.get('/user?sort=-userLastName,userName').get_json()
+    assert [u['userName'] for u in users] == ['user3', 'user2', 'user1']
+    response = client.get('/product?sort=productDescription')
+    assert response.status_code == 400 and 'productName' in response.get_json()['allowed']
+
+
+def test_fields(client, seed):
+    seed(products=3, pictures_per_product=2)
+    products = client.get('/product?fields=ProductName,photo').get_json()
+    assert [sorted(p) for p in products] == [['ProductName', 'photo']] * 3
+    assert all(len(p['photo']) == 2 for p in products)
+    page = client.get('/product?fields=productPrice&limit=2').get_json()
+    assert [list(p) for p in page['results']] == [['productPrice']] * 2
+    response = client.get('/product?fields=ProductName,secret')
+    assert response.status_code == 400 and 'secret' in response.get_json()['message']
+
+
+@pytest.mark.parametrize('sort', ['productPrice', '-productPrice', 'productPrice,-productName'])
+def test_cursor_pages_across_equal_values(app, client, seed, sort):
+    seed(products=20)
+    set_prices(app, ['1.50', '2.50', '3.50'])
+    expected = [p['ProductId'] for p in client.get('/product?sort=%s' % sort).get_json()]
+    pages, cursor = [], None
+    while True:
+        page = client.get('/product?sort=%s&limit=4%s' % (sort, '&after=%s' % cursor if cursor else '')).get_json()
+        pages.append([p['ProductId'] for p in page['results']])
+        cursor = page['next']
+        if cursor is None:
+            break
+    assert len(pages) == 5 and [i for page in pages for i in page] == expected
+
+
+def test_bad_cursors(client, seed):
+    seed(products=5)
+    assert client.get('/product?limit=2&after=abc').status_code == 400
+    assert client.get('/product?sort=productPrice&limit=2&after=abc').status_code == 400
+    # a cursor made for another sort
+    cursor = client.get('/product?sort=productPrice,productName&limit=2').get_json()['next']
+    response = client.get('/product?sort=productPrice&limit=2&after=%s' % cursor)
+    assert response.status_code == 400 and response.get_json()['message'] == 'Invalid after cursor'
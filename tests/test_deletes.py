@@ -0,0 +1,51 @@
+from models import db, Address, BillingAddress, Picture
+
+
+def test_deleting_a_user_deletes_its_addresses_in_the_database(app, client, seed, auth, statements):
+    seed(users=2, addresses_per_user=3)
+    headers = auth()
+    with statements() as executed:
+        assert client.delete('/user/2', headers=headers).status_code == 200
+    # ON DELETE CASCADE, the ORM doesn't load the children to delete them
+    assert not [s for s in executed if 'FROM addresses' in s or 'FROM billing_addresses' in s]
+    with app.app_context():
+        assert Address.query.filter_by(person_id=2).count() == 0
+        assert BillingAddress.query.filter_by(person_id=2).count() == 0
+        assert Address.query.filter_by(person_id=1).count() == 3
+
+
+def test_deleting_a_product_deletes_its_pictures_in_the_database(app, client, seed, statements):
+    seed(products=2, pictures_per_product=3)
+    client.get('/product/1')
+    with statements() as executed:
+        assert client.delete('/product/1').status_code == 200
+    assert not [s for s in executed if 'FROM pictures' in s]
+    with app.app_context():
+        assert Picture.query.filter_by(photos_id=1).count() == 0
+        assert Picture.query.filter_by(photos_id=2).count() == 3
+    assert client.get('/product/1').status_code == 404
+
+
+def test_bulk_picture_delete(app, client, seed, statements):
+    seed(products=3, pictures_per_product=3)
+    # cached, the delete drops it
+    assert len(client.get('/product/2').get_json()['photo']) == 3
+    with statements() as executed:
+        response = client.delete('/picture?photos_id=2')
+    # the DELETE and the change counters
+    assert response.get_json() == {"deleted": 3} and len(executed) == 2
+    assert client.get('/product/2').get_json()['photo'] == []
+
+    with app.app_context():
+        ids = [i for (i,) in db.session.query(Picture.id).filter_by(photos_id=3)]
+    response = client.delete('/picture?ids=%s' % ','.join(map(str, ids + [999])))
+    assert response.get_json() == {"deleted": 3}
+    with app.app_context():
+        assert Picture.query.count() == 3
+
+
+def test_bulk_picture_delete_needs_a_filter(app, client, seed):
+    seed(products=1, pictures_per_product=2)
+    assert client.delete('/picture').status_code == 400
+    with app.app_context():
+        assert Picture.query.count() == 2
@@ -0,0 +1,66 @@
+from models import db, TableChange
+
+
+def etag_of(client, path, **kwargs):
+    response = client.get(path, **kwargs)
+    assert response.status_code == 200
+    return response.headers['ETag'].strip('"')
+
+
+def not_modified(client, path, etag, headers=None):
+    return client.get(path, headers=dict(headers or {}, **{'If-None-Match': '"%s"' % etag})).status_code == 304
+
+
+def test_reused_id_changes_the_etags(client, seed):
+    seed(products=1, pictures_per_product=3)
+    collection, single = etag_of(client, '/picture'), etag_of(client, '/picture/3')
+    assert not_modified(client, '/picture', collection) and not_modified(client, '/picture/3', single)
+
+    # sqlite gives the next row the highest id again, with version 1 like the deleted one
+    assert client.delete('/picture/3').status_code == 200
+    assert client.post('/picture', json={"picture_url": "https://example.com/new.jpg", "photos_id": 1}).status_code == 200
+    assert client.get('/picture/3').get_json()['PictureURL'] == 'https://example.com/new.jpg'
+    assert not not_modified(client, '/picture', collection)
+    assert not not_modified(client, '/picture/3', single)
+
+
+def test_core_statements_change_the_etags(client, seed):
+    seed(products=2, pictures_per_product=2)
+    etag = etag_of(client, '/picture')
+    assert client.post('/picture/bulk', json=[{"picture_url": "https://example.com/b.jpg", "photos_id": 1}]).status_code == 200
+    assert not not_modified(client, '/picture', etag)
+
+    etag = etag_of(client, '/picture')
+    assert client.delete('/picture?photos_id=2').get_json() == {"deleted": 2}
+    assert not not_modified(client, '/picture', etag)
+
+    etag, single = etag_of(client, '/product'), etag_of(client, '/product/1')
+    assert client.patch('/product/1', json={"productName": "Patched"}).status_code == 200
+    assert not not_modified(client, '/product', etag) and not not_modified(client, '/product/1', single)
+
+
+def test_cascaded_deletes_change_the_child_etags(client, seed, auth):
+    seed(users=2, addresses_per_user=2)
+    headers = auth()
+    etag = etag_of(client, '/address')
+    assert client.delete('/user/2', headers=headers).status_code == 200
+    assert not not_modified(client, '/address', etag)
+    assert len(client.get('/address').get_json()) == 2
+
+
+def test_counters_only_count_committed_writes(app, client, seed):
+    seed(products=1)
+
+    def counters():
+        with app.app_context():
+            return dict(db.session.query(TableChange.table_name, TableChange.changes))
+
+    before = counters()
+    assert client.get('/product/1').status_code == 200
+    assert counters() == before
+    # a duplicate name is rolled back, nothing to count
+    assert client.patch('/product/1', json={"productName": "Product 1"}).status_code == 200
+    assert client.post('/product/bulk', json=[{"productName": "Product 1", "productPrice": 1}]).status_code == 207
+    after = counters()
+    assert after['products'] == before['products'] + 1
+    assert [name for name in after if after[name] != before[name]] == ['products']
@@ -0,0 +1,50 @@
+from models import db, Address, Product
+
+
+def test_patch_answers_like_get_and_bumps_the_version(app, client, seed):
+    seed(users=2, addresses_per_user=1)
+    response = client.patch('/address/1', json={"userCity": "Orlando", "isBillingAddress": False})
+    assert response.status_code == 200
+    assert response.get_json() == client.get('/address/1').get_json()
+    assert response.get_json()['UserCity'] == 'Orlando'
+    with app.app_context():
+        assert db.session.get(Address, 1).version == 2
+        assert db.session.get(Address, 2).userCity == 'Miami'
+
+
+def test_patch_nests_the_child_rows(client, seed):
+    seed(products=2, pictures_per_product=2)
+    response = client.patch('/product/1', json={"productPrice": "$1,299.50"})
+    assert response.get_json() == client.get('/product/1').get_json()
+    assert response.get_json()['productPrice'] == '1299.50' and len(response.get_json()['photo']) == 2
+
+
+def test_patch_return_minimal(app, client, seed, statements):
+    seed(users=1)
+    with statements() as executed:
+        response = client.patch('/address/1', json={"userCity": "Tampa"}, headers={'Prefer': 'return=minimal'})
+    assert response.status_code == 204 and response.get_data() == b''
+    assert response.headers['Preference-Applied'] == 'return=minimal'
+    assert not [s for s in executed if s.startswith('SELECT')]
+    with app.app_context():
+        assert db.session.get(Address, 1).userCity == 'Tampa'
+
+
+def test_patch_of_a_missing_row_is_404(client, seed):
+    seed(users=1)
+    assert client.patch('/address/999', json={"userCity": "Tampa"}).status_code == 404
+    assert client.patch('/address/999', json={"userCity": "Tampa"}, headers={'Prefer': 'return=minimal'}).status_code == 404
+
+
+def test_patch_rejects_invalid_bodies(app, client, seed):
+    seed(users=2, products=2)
+    assert client.patch('/address/1', json={}).status_code == 400
+    response = client.patch('/address/1', json={"person_id": 2})
+    assert response.status_code == 400 and 'person_id' in response.get_json()['message']
+    response = client.patch('/address/1', json={"userCity": None, "userZipCode": "x" * 13})
+    assert response.status_code == 400
+    assert [e['field'] for e in response.get_json()['errors']] == ['userCity', 'userZipCode']
+    assert client.patch('/product/2', json={"productName": "Product 1"}).status_code == 409
+    with app.app_context():
+        assert db.session.get(Address, 1).userCity == 'Miami'
+        assert db.session.get(Product, 2).productName == 'Product 2'
@@ -0,0 +1,42 @@
+import pytest
+from decimal import Decimal
+from models import db, Product
+
+
+@pytest.mark.parametrize('price, message', [
+    ("1e20", "productPrice must be less than 100000000"),
+    (-5, "productPrice can not be negative"),
+    ("12.345", "productPrice can have at most 2 decimals"),
+    ("abc", "productPrice must be a number"),
+])
+def test_invalid_prices_are_refused_everywhere(client, seed, price, message):
+    seed(products=1)
+    body = {"productName": "New", "productDescription": None, "productPrice": price,
+            "productCategory": None, "productAgeRange": None}
+    response = client.post('/product', json=body)
+    assert response.status_code == 400 and response.get_json()['message'] == message
+    response = client.put('/product/1', json={"productPrice": price})
+    assert response.status_code == 400 and response.get_json()['message'] == message
+    response = client.patch('/product/1', json={"productPrice": price})
+    assert response.status_code == 400 and response.get_json()['errors'][0]['message'] == message
+    response = client.post('/product/bulk', json=[{"productName": "New", "productPrice": price}])
+    assert response.status_code == 400 and response.get_json()['errors'][0]['message'] == message
+    assert client.get('/product/1').get_json()['productPrice'] == '1.99'
+
+
+def test_valid_prices(client, seed):
+    seed(products=1)
+    for price, stored in (("$1,299.9", "1299.90"), (0, "0.00"), ("99999999.99", "99999999.99")):
+        assert client.patch('/product/1', json={"productPrice": price}).get_json()['productPrice'] == stored
+
+
+def test_stats_buckets_round_down(app, client, seed):
+    seed()
+    with app.app_context():
+        # rows written before prices were checked
+        db.session.add_all([Product(productName='a', productPrice=Decimal('-2.5'), productCategory='c'),
+                            Product(productName='b', productPrice=Decimal('12.5'), productCategory='c')])
+        db.session.commit()
+    histogram = client.get('/product/stats?bucket=10').get_json()['categories'][0]['histogram']
+    assert histogram == [{"from": -10.0, "to": 0.0, "count": 1}, {"from": 10.0, "to": 20.0, "count": 1}]
+    assert client.get('/product/stats?bucket=0.001').status_code == 400
@@ -0,0 +1,106 @@
+import time
+import shutil
+from collections import Counter
+import pytest
+from sqlalchemy import event
+import main
+import replicas
+from models import db, Product
+
+STALENESS = 0.5
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    """
+    A second SQLite file standing in for a replica, copy() brings it up to date with the primary.
+    Goes before the app fixture, create_app() adds the replica bind.
+    """
+    url = 'sqlite:///%s' % tmp_path.joinpath('replica.db')
+    for module in (main, replicas):
+        monkeypatch.setattr(module, 'REPLICA_URLS', [url])
+    monkeypatch.setattr(replicas, 'STALENESS', STALENESS)
+    monkeypatch.setattr(replicas.REPLAYER, 'delay', STALENESS)
+
+    class Replica(object):
+
+        def __init__(self):
+            self.served = Counter()
+
+        def copy(self, app):
+            with app.app_context():
+                for engine in db.engines.values():
+                    engine.dispose()
+                shutil.copy(db.engine.url.database, tmp_path.joinpath('replica.db'))
+
+        def listen(self, app):
+            with app.app_context():
+                [engine] = replicas.replica_engines(db)
+                for name, bound in (('primary', db.engine), ('replica', engine)):
+                    event.listen(bound, 'before_cursor_execute', lambda *args, name=name: self.served.update([name]))
+
+        def count(self, call):
+            self.served.clear()
+            response = call()
+            return response, dict(self.served)
+    yield Replica()
+    # init_app() made a MetaData for the bind on db, the next apps have no such bind
+    db.metadatas.pop('replica0', None)
+
+
+@pytest.fixture
+def replicated(replica, app, seed):
+    seed(users=5, addresses_per_user=3, products=5, pictures_per_product=2)
+    replica.copy(app)
+    replica.listen(app)
+    return replica
+
+
+def test_reads_go_to_the_replica(replicated, app, auth):
+    headers = auth()
+    reader = app.test_client()
+    response, served = replicated.count(lambda: reader.get('/user/1', headers=headers))
+    # the lazy loads of the addresses included
+    assert response.status_code == 200 and len(response.get_json()['addresses']) == 3
+    assert set(served) == {'replica'} and served['replica'] >= 3
+    response, served = replicated.count(lambda: reader.get('/product'))
+    assert response.status_code == 200 and set(served) == {'replica'}
+
+
+def test_the_writer_reads_its_writes_from_the_primary(replicated, app):
+    writer, reader = app.test_client(), app.test_client()
+    response, served = replicated.count(lambda: writer.put('/product/1', json={"productName": "Renamed"}))
+    assert response.status_code == 200 and set(served) == {'primary'}
+    assert replicas.PRIMARY_COOKIE in response.headers['Set-Cookie']
+
+    response, served = replicated.count(lambda: writer.get('/product/1'))
+    assert response.get_json()['ProductName'] == 'Renamed' and set(served) == {'primary'}
+    # the replica hasn't applied the write
+    response, served = replicated.count(lambda: reader.get('/product/1'))
+    assert response.get_json()['ProductName'] == 'Product 1' and set(served) == {'replica'}
+
+    time.sleep(STALENESS + 0.2)
+    response, served = replicated.count(lambda: writer.get('/product/2'))
+    assert response.status_code == 200 and set(served) == {'replica'}
+
+
+def test_responses_cached_from_a_stale_replica_are_dropped(replicated, app):
+    writer, reader = app.test_client(), app.test_client()
+    assert writer.put('/product/1', json={"productName": "Renamed"}).status_code == 200
+    # filled from the replica after the write invalidated the entry
+    assert not any(p['ProductName'] == 'Renamed' for p in reader.get('/product').get_json())
+    assert reader.get('/product').headers['X-Cache'] == 'HIT'
+
+    replicated.copy(app)
+    time.sleep(STALENESS + 0.3)
+    response = reader.get('/product')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert any(p['ProductName'] == 'Renamed' for p in response.get_json())
+
+
+def test_reads_outside_a_request_use_the_primary(replicated, app):
+    with app.app_context():
+        replicated.served.clear()
+        assert db.session.get(Product, 1) is not None
+        db.session.rollback()
+    assert set(replicated.served) == {'primary'}
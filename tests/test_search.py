@@ -0,0 +1,56 @@
+import pytest
+
+
+@pytest.mark.parametrize('limit', ['0', '-1', '101', 'ten'])
+def test_search_rejects_limits_out_of_range(client, seed, limit):
+    seed(products=3)
+    response = client.get('/product/search?q=product&limit=%s' % limit)
+    assert response.status_code == 400
+
+
+def test_search_limit(client, seed):
+    seed(products=5)
+    assert len(client.get('/product/search?q=product&limit=2').get_json()['results']) == 2
+    assert len(client.get('/product/search?q=product&limit=100').get_json()['results']) == 5
+
+
+def version_scans(executed):
+    # the whole table, the changed rows are read by id after it
+    return [s for s in executed if s.startswith('SELECT products.id, products.version \nFROM')]
+
+
+def test_own_writes_do_not_resync_the_index(app, client, seed, statements, monkeypatch):
+    import search
+    seed(products=5)
+    assert client.get('/product/search?q=product').status_code == 200
+    monkeypatch.setattr(search, 'SYNC_INTERVAL', 0)
+    assert client.put('/product/2', json={"productName": "Teddy bear"}).status_code == 200
+    assert client.delete('/product/3').status_code == 200
+    assert client.post('/product', json={
+        "productName": "Kite", "productDescription": "A kite", "productPrice": "9.99",
+        "productCategory": "toys", "productAgeRange": "6-9"}).status_code == 200
+    with statements() as executed:
+        kite = client.get('/product/search?q=kite').get_json()['results']
+        bear = client.get('/product/search?q=teddy').get_json()['results']
+        products = client.get('/product/search?q=product').get_json()['results']
+    assert version_scans(executed) == []
+    assert [r['ProductName'] for r in kite] == ['Kite'] and [r['ProductId'] for r in bear] == [2]
+    assert sorted(r['ProductId'] for r in products) == [1, 4, 5]
+
+
+def test_writes_of_another_process_resync_the_index(app, client, seed, statements, monkeypatch):
+    import sqlite3
+    import search
+    from models import db
+    seed(products=5)
+    assert client.get('/product/search?q=product').status_code == 200
+    monkeypatch.setattr(search, 'SYNC_INTERVAL', 0)
+    with app.app_context():
+        conn = sqlite3.connect(db.engine.url.database)
+    with conn:
+        conn.execute("UPDATE products SET productName = 'Teddy bear', version = version + 1 WHERE id = 2")
+        conn.execute("UPDATE table_changes SET changes = changes + 1 WHERE table_name = 'products'")
+    conn.close()
+    with statements() as executed:
+        results = client.get('/product/search?q=teddy').get_json()['results']
+    assert len(version_scans(executed)) == 1 and [r['ProductId'] for r in results] == [2]
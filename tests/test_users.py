@@ -0,0 +1,50 @@
+def test_user_list_statement_count_does_not_grow(client, seed, statements):
+    counts = []
+    for users in (1, 10, 100):
+        seed(users=users, addresses_per_user=2)
+        with statements() as executed:
+            response = client.get('/user')
+        assert response.status_code == 200 and len(response.get_json()) == users
+        counts.append(len(executed))
+    assert len(set(counts)) == 1, counts
+
+
+def test_user_list_nests_addresses(client, seed):
+    seed(users=3, addresses_per_user=2)
+    users = client.get('/user').get_json()
+    assert [len(user['addresses']) for user in users] == [2, 2, 2]
+    assert all(address['user'] == user['userid'] for user in users for address in user['addresses'])
+
+
+def test_password_is_never_served(client, seed, auth):
+    seed(users=2)
+    headers = auth()
+    responses = [client.get('/user'), client.get('/user?ids=1,2'), client.get('/user/1', headers=headers),
+                 client.patch('/user/1', json={"userFirstName": "Changed"}, headers=headers)]
+    for response in responses:
+        assert response.status_code == 200
+        assert 'password' not in response.get_data(as_text=True)
+    assert client.get('/user?fields=userName,password').status_code == 400
+
+
+def login(client, user, password):
+    return client.post('/login', json={"userName": user, "email": "%s@example.com" % user, "password": password})
+
+
+def test_login_rejects_a_wrong_password_or_an_unknown_user(client, seed):
+    seed(users=2)
+    assert login(client, 'user1', 'secret2').status_code == 401
+    assert login(client, 'nobody', 'secret1').status_code == 401
+    assert login(client, 'user1', 'secret1').status_code == 200
+
+
+def test_login_rehashes_a_plain_text_password(app, client, seed):
+    from models import db, User
+    seed(users=1)
+    assert login(client, 'user1', 'secret1').status_code == 200
+    with app.app_context():
+        stored = db.session.get(User, 1).password
+    assert stored.startswith('pbkdf2_sha256$') and 'secret1' not in stored
+    # the hash is verified from then on
+    assert login(client, 'user1', 'secret1').status_code == 200
+    assert login(client, 'user1', 'secret').status_code == 401
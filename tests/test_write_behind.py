@@ -0,0 +1,126 @@
+import time
+import threading
+import pytest
+import main
+import writebehind
+from models import db, Picture, Address
+
+ASYNC = {'Prefer': 'respond-async'}
+
+
+@pytest.fixture
+def writes(app, monkeypatch):
+    """
+    A queue of its own for the test, the one of main.py lives as long as the process
+    """
+    queue = writebehind.WriteBehindQueue(maxsize=100, batch_size=20)
+    queue.init_app(app)
+    queue.writers = dict(main.WRITES.writers)
+    monkeypatch.setattr(main, 'WRITES', queue)
+    yield queue
+    queue.close()
+
+
+def picture(i, prefix='async'):
+    return {"picture_url": "https://example.com/%s/%d.jpg" % (prefix, i), "photos_id": i % 3 + 1}
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def hold_worker(writes, kind):
+    """
+    The first write of kind waits for the returned event, the next ones queue up behind it
+    """
+    release, write = threading.Event(), writes.writers[kind]
+
+    def held(body):
+        release.wait(10)
+        write(body)
+    writes.writers[kind] = held
+    return release
+
+
+def submit_held(client, writes, i):
+    """
+    Queues a write and waits for the worker to take it, its batch is this write alone
+    """
+    response = client.post('/picture', json=picture(i), headers=ASYNC)
+    wait_until(lambda: writes.stats()['queued'] == 0)
+    return response
+
+
+def test_queued_writes_are_applied_in_batches(app, client, seed, writes):
+    seed(products=3, pictures_per_product=0)
+    release = hold_worker(writes, 'picture_create')
+    responses = [submit_held(client, writes, 0)]
+    responses += [client.post('/picture', json=picture(i), headers=ASYNC) for i in range(1, 60)]
+    assert all(r.status_code == 202 for r in responses)
+    assert responses[0].headers['Location'] == '/writes/%s' % responses[0].get_json()['trackingId']
+    release.set()
+    wait_until(lambda: writes.stats()['applied'] == 60)
+    # the held write alone, then the 59 queued behind it in batches of 20, one commit each
+    assert writes.stats()['batches'] == 4
+    with app.app_context():
+        assert Picture.query.count() == 60
+    for response in responses:
+        assert client.get(response.headers['Location']).get_json()['status'] == 'done'
+    assert client.get('/writes/unknown').status_code == 404
+
+
+def test_a_failing_write_does_not_fail_its_batch(app, client, seed, writes):
+    seed(users=3, addresses_per_user=1)
+    release = hold_worker(writes, 'address_update')
+    ids = [client.put('/address/%d' % i, json={"userCity": "Async %d" % i}, headers=ASYNC).get_json()['trackingId']
+           for i in (1, 2, 100000, 3)]
+    release.set()
+    wait_until(lambda: writes.stats()['applied'] + writes.stats()['failed'] == 4)
+    statuses = [client.get('/writes/%s' % i).get_json() for i in ids]
+    assert [s['status'] for s in statuses] == ['done', 'done', 'failed', 'done']
+    assert 'not found' in statuses[2]['error']
+    with app.app_context():
+        assert [db.session.get(Address, i).userCity for i in (1, 2, 3)] == ['Async 1', 'Async 2', 'Async 3']
+
+
+def test_validation_answers_right_away(client, seed, writes):
+    seed(products=1)
+    assert client.post('/picture', json={"photos_id": 1}, headers=ASYNC).status_code == 400
+    assert client.post('/picture', json={"picture_url": "x"}, headers=ASYNC).status_code == 400
+    assert writes.stats()['accepted'] == 0
+
+
+def test_full_queue_answers_503(client, seed, writes, monkeypatch):
+    seed(products=3, pictures_per_product=0)
+    small = writebehind.WriteBehindQueue(maxsize=5, batch_size=1)
+    small.init_app(writes.app)
+    small.writers = dict(writes.writers)
+    release = hold_worker(small, 'picture_create')
+    monkeypatch.setattr(main, 'WRITES', small)
+    monkeypatch.setattr(writebehind, 'ENQUEUE_TIMEOUT', 0.05)
+    try:
+        codes = [submit_held(client, small, 0).status_code]
+        codes += [client.post('/picture', json=picture(i), headers=ASYNC).status_code for i in range(1, 10)]
+        # one write held by the worker and five queued
+        assert codes == [202] * 6 + [503] * 4
+        rejected = client.post('/picture', json=picture(10), headers=ASYNC)
+        assert rejected.status_code == 503 and rejected.headers['Retry-After'] == '1'
+        assert small.stats()['rejected'] == 5
+    finally:
+        release.set()
+        small.close()
+
+
+def test_close_applies_the_queued_writes(app, client, seed, writes):
+    seed(products=3, pictures_per_product=0)
+    release = hold_worker(writes, 'picture_create')
+    for i in range(50):
+        assert client.post('/picture', json=picture(i, 'drain'), headers=ASYNC).status_code == 202
+    release.set()
+    writes.close()
+    with app.app_context():
+        assert Picture.query.count() == 50
+    assert client.post('/picture', json=picture(0, 'late'), headers=ASYNC).status_code == 503